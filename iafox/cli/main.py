@@ -3,9 +3,13 @@ Interface CLI do IAFOX - Similar ao Claude Code
 """
 
 import asyncio
+import concurrent.futures
+import signal
 import sys
+import threading
+import time
 from pathlib import Path
-from typing import Optional
+from typing import Awaitable, Optional
 
 import typer
 from rich.console import Console
@@ -18,8 +22,9 @@ from rich.spinner import Spinner
 from rich.text import Text
 
 from ..core.agent import IAFOXAgent
-from ..core.config import config, IAFOXConfig
-from ..llm.ollama_client import OllamaClient
+from ..core.config import config, IAFOXConfig, DEFAULT_CONFIG_PATH
+from ..llm.ollama_client import OllamaClient, model_in_list
+from ..utils.streaming import coalesce_chunks
 
 app = typer.Typer(
     name="iafox",
@@ -29,6 +34,16 @@ app = typer.Typer(
 
 console = Console()
 
+# Cliente Ollama compartilhado pelos comandos (mantem conexoes keep-alive)
+_client: Optional[OllamaClient] = None
+
+# Streaming: acumula chunks antes de imprimir (caracteres / segundos)
+STREAM_FLUSH_CHARS = 64
+STREAM_FLUSH_INTERVAL = 0.03
+
+# Intervalo minimo (s) entre atualizacoes de progresso de download
+PROGRESS_INTERVAL = 0.1
+
 
 def print_banner():
     """Exibe banner do IAFOX"""
@@ -66,6 +81,103 @@ def print_help():
     console.print(Panel(help_text, title="Ajuda", border_style="blue"))
 
 
+def get_client(model: Optional[str] = None) -> OllamaClient:
+    """Retorna o cliente Ollama compartilhado"""
+    global _client
+    if _client is None:
+        _client = OllamaClient(model=model)
+    elif model:
+        _client.model = model
+    return _client
+
+
+async def close_client():
+    """Fecha o cliente compartilhado (uma vez, ao sair do event loop)"""
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+
+
+async def _run_and_close(coro):
+    """Roda comando e fecha os clientes compartilhados no mesmo event loop"""
+    try:
+        return await coro
+    finally:
+        await close_client()
+        from ..tools.image.gerar_imagem import fechar_gerador
+        await fechar_gerador()
+
+
+# Leitura de stdin em andamento (continua valendo apos Ctrl+C no prompt)
+_pending_read: Optional[concurrent.futures.Future] = None
+
+
+async def ainput(prompt: str) -> str:
+    """
+    Le entrada do usuario sem bloquear o event loop
+
+    Usa uma thread daemon (e nao asyncio.to_thread) para que uma leitura
+    pendente nao impeca o processo de sair. Se a espera for cancelada
+    (Ctrl+C), a leitura em andamento e reaproveitada na proxima chamada
+    em vez de abrir uma segunda thread lendo o mesmo stdin.
+    """
+    global _pending_read
+    read = _pending_read
+    if read is None:
+        read = _pending_read = concurrent.futures.Future()
+
+        def worker():
+            try:
+                read.set_result(Prompt.ask(prompt))
+            except BaseException as e:
+                read.set_exception(e)
+
+        threading.Thread(target=worker, daemon=True).start()
+    else:
+        # Thread anterior ainda esperando o Enter: so mostra o prompt de novo
+        console.print(f"{prompt}: ", end="")
+
+    try:
+        # shield: cancelar a espera nao cancela a leitura
+        return await asyncio.shield(asyncio.wrap_future(read))
+    finally:
+        if read.done():
+            _pending_read = None
+
+
+class _CtrlC:
+    """
+    Handler de SIGINT do chat: Ctrl+C interrompe so a etapa atual (prompt ou
+    resposta) com KeyboardInterrupt, em vez de cancelar o asyncio.run inteiro
+    """
+
+    def __init__(self, main_task: asyncio.Task):
+        self._main_task = main_task
+        self._step: Optional[asyncio.Future] = None
+        self._hit = False
+
+    def __call__(self):
+        if self._step is not None and not self._step.done():
+            self._hit = True
+            self._step.cancel()
+        else:
+            self._main_task.cancel()
+
+    async def run(self, aw: Awaitable):
+        """Executa uma etapa interrompivel por Ctrl+C"""
+        self._step = asyncio.ensure_future(aw)
+        self._hit = False
+        try:
+            return await self._step
+        except asyncio.CancelledError:
+            if self._hit:
+                raise KeyboardInterrupt from None
+            raise
+        finally:
+            self._step = None
+
+
 async def check_ollama(client: OllamaClient) -> bool:
     """Verifica conexao com Ollama"""
     try:
@@ -84,10 +196,8 @@ async def check_model(client: OllamaClient, model: str) -> bool:
         model_names = [m.get("name", "") for m in models]
 
         # Verifica se modelo existe
-        model_base = model.split(":")[0]
-        for m in model_names:
-            if m.startswith(model_base):
-                return True
+        if model_in_list(model, set(model_names)):
+            return True
 
         console.print(f"[yellow]Modelo '{model}' nao encontrado.[/yellow]")
         console.print(f"[yellow]Modelos disponiveis: {', '.join(model_names)}[/yellow]")
@@ -95,13 +205,22 @@ async def check_model(client: OllamaClient, model: str) -> bool:
         # Oferece baixar
         if Prompt.ask(f"Deseja baixar o modelo '{model}'?", choices=["s", "n"], default="s") == "s":
             console.print(f"[cyan]Baixando {model}...[/cyan]")
+            last_print = 0.0
+            pending = None
             async for progress in client.pull_model(model):
                 status = progress.get("status", "")
                 if "pulling" in status:
                     completed = progress.get("completed", 0)
                     total = progress.get("total", 1)
                     pct = (completed / total * 100) if total else 0
-                    console.print(f"\r[cyan]{status}: {pct:.1f}%[/cyan]", end="")
+                    pending = f"\r[cyan]{status}: {pct:.1f}%[/cyan]"
+                    now = time.monotonic()
+                    if now - last_print >= PROGRESS_INTERVAL:
+                        console.print(pending, end="")
+                        last_print = now
+                        pending = None
+            if pending:
+                console.print(pending, end="")
             console.print("\n[green]Modelo baixado com sucesso![/green]")
             return True
         return False
@@ -114,7 +233,7 @@ async def check_model(client: OllamaClient, model: str) -> bool:
 async def run_chat(workspace: Path, model: str):
     """Loop principal de chat"""
     # Inicializa cliente e agente
-    client = OllamaClient(model=model)
+    client = get_client(model)
 
     # Verifica Ollama
     if not await check_ollama(client):
@@ -133,10 +252,21 @@ async def run_chat(workspace: Path, model: str):
     console.print(f"Workspace: [cyan]{workspace}[/cyan]")
     console.print("Digite [bold]/help[/bold] para ver comandos\n")
 
+    # Ctrl+C interrompe a etapa atual; o handler sai junto com o event loop
+    ctrl_c = _CtrlC(asyncio.current_task())
+    loop = asyncio.get_running_loop()
+    try:
+        loop.add_signal_handler(signal.SIGINT, ctrl_c)
+    except NotImplementedError:
+        # Windows: sem handler no loop, o handler comum repassa para o loop
+        signal.signal(signal.SIGINT, lambda *_: loop.call_soon_threadsafe(ctrl_c))
+    except RuntimeError:
+        pass  # Fora da thread principal: fica o comportamento padrao
+
     while True:
         try:
             # Prompt
-            user_input = Prompt.ask("\n[bold cyan]voce[/bold cyan]")
+            user_input = await ctrl_c.run(ainput("\n[bold cyan]voce[/bold cyan]"))
 
             if not user_input.strip():
                 continue
@@ -159,7 +289,7 @@ async def run_chat(workspace: Path, model: str):
                     continue
 
                 elif cmd == "/model":
-                    models = await client.list_models()
+                    models = await ctrl_c.run(client.list_models())
                     console.print("[bold]Modelos disponiveis:[/bold]")
                     for m in models:
                         name = m.get("name", "")
@@ -177,7 +307,7 @@ async def run_chat(workspace: Path, model: str):
                     continue
 
                 elif cmd == "/tree":
-                    tree = await file_manager.get_file_tree(".", max_depth=2)
+                    tree = await ctrl_c.run(file_manager.get_file_tree(".", max_depth=2))
                     console.print(Panel(str(tree), title="Arvore de Arquivos"))
                     continue
 
@@ -188,11 +318,14 @@ async def run_chat(workspace: Path, model: str):
             # Processa mensagem
             console.print("\n[bold magenta]iafox[/bold magenta]")
 
-            response_text = ""
-            async for chunk in agent.chat(user_input, stream=True):
-                console.print(chunk, end="")
-                response_text += chunk
+            # Imprime em lotes - um console.print por token e caro
+            async def respond():
+                async for text in coalesce_chunks(
+                    agent.chat(user_input, stream=True), STREAM_FLUSH_CHARS, STREAM_FLUSH_INTERVAL
+                ):
+                    console.print(text, end="")
 
+            await ctrl_c.run(respond())
             console.print()  # Nova linha no final
 
         except KeyboardInterrupt:
@@ -203,8 +336,6 @@ async def run_chat(workspace: Path, model: str):
             console.print(f"\n[red]Erro: {e}[/red]")
             continue
 
-    await client.close()
-
 
 @app.command()
 def chat(
@@ -232,14 +363,14 @@ def chat(
         raise typer.Exit(1)
 
     # Roda chat
-    asyncio.run(run_chat(workspace, model))
+    asyncio.run(_run_and_close(run_chat(workspace, model)))
 
 
 @app.command()
 def models():
     """Lista modelos disponiveis no Ollama"""
     async def list_models():
-        client = OllamaClient()
+        client = get_client()
         try:
             models = await client.list_models()
             console.print("[bold]Modelos instalados:[/bold]\n")
@@ -252,10 +383,8 @@ def models():
                 console.print(f"    Modificado: {modified}\n")
         except Exception as e:
             console.print(f"[red]Erro: {e}[/red]")
-        finally:
-            await client.close()
 
-    asyncio.run(list_models())
+    asyncio.run(_run_and_close(list_models()))
 
 
 @app.command()
@@ -264,25 +393,35 @@ def pull(
 ):
     """Baixa um modelo do Ollama"""
     async def download():
-        client = OllamaClient()
+        client = get_client()
         try:
             console.print(f"[cyan]Baixando {model}...[/cyan]")
+            last_print = 0.0
+            pending = None
             async for progress in client.pull_model(model):
                 status = progress.get("status", "")
                 if "pulling" in status:
                     completed = progress.get("completed", 0)
                     total = progress.get("total", 1)
                     pct = (completed / total * 100) if total else 0
-                    console.print(f"\r{status}: {pct:.1f}%", end="")
+                    pending = f"\r{status}: {pct:.1f}%"
+                    now = time.monotonic()
+                    if now - last_print >= PROGRESS_INTERVAL:
+                        console.print(pending, end="")
+                        last_print = now
+                        pending = None
                 else:
+                    if pending:
+                        console.print(pending, end="")
+                        pending = None
                     console.print(status)
+            if pending:
+                console.print(pending, end="")
             console.print("\n[green]Concluido![/green]")
         except Exception as e:
             console.print(f"[red]Erro: {e}[/red]")
-        finally:
-            await client.close()
 
-    asyncio.run(download())
+    asyncio.run(_run_and_close(download()))
 
 
 @app.command()
@@ -291,7 +430,7 @@ def config_cmd(
     init: bool = typer.Option(False, "--init", "-i", help="Cria configuracao inicial")
 ):
     """Gerencia configuracao do IAFOX"""
-    config_path = Path.home() / ".iafox" / "config.json"
+    config_path = DEFAULT_CONFIG_PATH
 
     if show:
         if config_path.exists():
@@ -2,32 +2,312 @@
 Agente principal do IAFOX - Orquestra LLM + Ferramentas
 """
 
-import json
-import re
-from typing import AsyncGenerator, Optional, Callable, Any
-from pydantic import BaseModel
-from ..llm.ollama_client import OllamaClient, Message
-from ..files.manager import FileManager, FileContent
-from ..tools.web_search import buscar_web, buscar_noticias
-from ..tools.rag import buscar_nos_livros, verificar_index_existe
-from ..tools.image.gerar_imagem import gerar_imagem
+import asyncio
+import io
+import os
+import sys
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, AsyncGenerator, Awaitable, Callable, Optional
+
+from ..files.manager import FileContent, FileManager
+from ..llm.ollama_client import Message, OllamaClient
+from ..utils.process import kill_process
+from ..utils.serialization import JSONDecodeError, json_loads
 from .config import config
 
+# Marcadores das chamadas de ferramentas: <tool>nome</tool><args>{...}</args>
+_TOOL_OPEN, _TOOL_CLOSE = "<tool>", "</tool>"
+_ARGS_OPEN, _ARGS_CLOSE = "<args>", "</args>"
 
-class ToolCall(BaseModel):
+# Ferramentas sem efeitos colaterais - podem rodar em paralelo
+PARALLEL_SAFE_TOOLS = frozenset({
+    "read_file", "list_files", "search_files", "file_tree",
+    "web_search", "search_news", "buscar_livros", "gerar_imagem",
+})
+
+# Maximo de texto pendente (chamada ainda aberta) no scanner de streaming
+MAX_PENDING_TOOL_CALL = 256 * 1024
+
+# Segundos que uma arvore formatada vale (mudancas em subpastas nao mudam o
+# mtime da raiz)
+TREE_CACHE_TTL = 5.0
+
+# Limites da saida guardada de execute_command
+MAX_COMMAND_OUTPUT_LINES = 10_000
+MAX_COMMAND_LINE_LENGTH = 8 * 1024
+COMMAND_READ_SIZE = 64 * 1024
+
+
+async def _drain_stream(stream: asyncio.StreamReader, buffer: deque) -> int:
+    """
+    Consome um stream linha a linha guardando apenas as ultimas linhas
+
+    Le em blocos (sem o limite de linha do StreamReader); linhas maiores que
+    MAX_COMMAND_LINE_LENGTH ficam com o inicio e um marcador de truncamento.
+
+    Returns:
+        Numero total de linhas lidas
+    """
+    count = 0
+    line = bytearray()
+    truncated = False
+
+    def push(piece: bytes):
+        nonlocal truncated
+        room = MAX_COMMAND_LINE_LENGTH - len(line)
+        if len(piece) > room:
+            truncated = True
+            piece = piece[:room]
+        line.extend(piece)
+
+    def end_line(newline: bool):
+        nonlocal truncated, count
+        text = line.decode(errors="replace")
+        if truncated:
+            text += " [... linha truncada]"
+        buffer.append(text + "\n" if newline else text)
+        count += 1
+        line.clear()
+        truncated = False
+
+    while chunk := await stream.read(COMMAND_READ_SIZE):
+        start = 0
+        while (nl := chunk.find(b"\n", start)) >= 0:
+            push(chunk[start:nl])
+            end_line(True)
+            start = nl + 1
+        push(chunk[start:])
+
+    if line or truncated:
+        end_line(False)
+    return count
+
+
+def _format_stream_output(buffer: deque, total_lines: int) -> str:
+    """Junta as linhas guardadas indicando se houve truncamento"""
+    output = "".join(buffer)
+    omitted = total_lines - len(buffer)
+    if omitted > 0:
+        output = f"[... {omitted} linhas omitidas ...]\n{output}"
+    return output
+
+
+def _find_json_end(text: str, start: int) -> int:
+    """
+    Encontra o fim do objeto JSON que comeca em text[start] ("{")
+
+    Conta chaves fora de strings; o conteudo das strings e pulado com
+    str.find, entao "}" ou "</args>" dentro de valores nao atrapalham.
+
+    Returns:
+        Indice apos a "}" final, -1 se o objeto ainda nao terminou ou -2 se
+        apareceu "<" fora de string (JSON invalido, ex.: "}" faltando antes
+        de "</args>")
+    """
+    depth = 0
+    i = start
+    n = len(text)
+    while i < n:
+        c = text[i]
+        if c == '"':
+            # Pula a string inteira (respeitando aspas escapadas)
+            i += 1
+            while True:
+                q = text.find('"', i)
+                if q < 0:
+                    return -1
+                b = q - 1
+                while text[b] == "\\":
+                    b -= 1
+                i = q + 1
+                if (q - 1 - b) % 2 == 0:
+                    break
+            continue
+        if c == "{":
+            depth += 1
+        elif c == "<":
+            return -2
+        elif c == "}":
+            depth -= 1
+            if depth == 0:
+                return i + 1
+        i += 1
+    return -1
+
+
+def _scan_tool_calls(
+    text: str,
+    start: int = 0,
+    final: bool = False
+) -> tuple[list[tuple[str, str]], int]:
+    """
+    Varre o texto atras de chamadas de ferramentas (passada linear, sem regex)
+
+    Chamada com args invalidos e ignorada e a varredura continua depois dela.
+    Com final=True o texto esta completo: args que nao fecham (string sem
+    aspas finais) tambem sao invalidos em vez de "ainda incompletos".
+
+    Returns:
+        Pares (nome, args JSON) completos e a posicao onde uma nova varredura
+        deve recomecar (inicio de uma chamada ainda incompleta)
+    """
+    found: list[tuple[str, str]] = []
+    pos = start
+    n = len(text)
+
+    while True:
+        i = text.find(_TOOL_OPEN, pos)
+        if i < 0:
+            # Guarda um possivel "<tool" cortado no fim do texto
+            return found, max(pos, n - len(_TOOL_OPEN) + 1)
+
+        name_start = i + len(_TOOL_OPEN)
+        j = text.find(_TOOL_CLOSE, name_start)
+        if j < 0:
+            return found, i
+        name = text[name_start:j]
+        args_tag = j + len(_TOOL_CLOSE)
+        if not name.replace("_", "").isalnum():
+            pos = name_start
+            continue
+
+        args_start = args_tag + len(_ARGS_OPEN)
+        if n < args_start:
+            if _ARGS_OPEN.startswith(text[args_tag:]):
+                return found, i
+            pos = args_tag
+            continue
+        if not text.startswith(_ARGS_OPEN, args_tag):
+            pos = args_tag
+            continue
+
+        k = args_start
+        while k < n and text[k].isspace():
+            k += 1
+        if k == n:
+            return found, i
+        if text[k] != "{":
+            pos = args_start
+            continue
+
+        end = _find_json_end(text, k)
+        if end == -1 and not final:
+            return found, i
+        if end < 0:
+            # Args invalidos: procura a proxima chamada
+            pos = args_start
+            continue
+
+        close = end
+        while close < n and text[close].isspace():
+            close += 1
+        if n - close < len(_ARGS_CLOSE) and _ARGS_CLOSE.startswith(text[close:]):
+            return found, i
+        if not text.startswith(_ARGS_CLOSE, close):
+            pos = args_start
+            continue
+
+        found.append((name, text[k:end]))
+        pos = close + len(_ARGS_CLOSE)
+
+
+class _ToolCallStream:
+    """
+    Detecta chamadas de ferramentas completas enquanto a resposta chega
+
+    Guarda apenas o trecho ainda nao resolvido e so re-varre quando um
+    "</args>" aparece no texto novo.
+    """
+
+    __slots__ = ("_pending", "_in_call")
+
+    def __init__(self):
+        self._pending = ""
+        self._in_call = False
+
+    def feed(self, chunk: str) -> list[tuple[str, str]]:
+        """Adiciona um chunk e retorna as chamadas que ficaram completas"""
+        self._pending += chunk
+        window = len(chunk) + len(_ARGS_CLOSE)
+
+        if not self._in_call:
+            if _TOOL_OPEN not in self._pending[-window:]:
+                self._pending = self._pending[-len(_TOOL_OPEN):]
+                return []
+            self._in_call = True
+
+        if _ARGS_CLOSE not in self._pending[-window:]:
+            return []
+
+        found, pos = _scan_tool_calls(self._pending)
+        self._pending = self._pending[pos:]
+        if len(self._pending) > MAX_PENDING_TOOL_CALL:
+            # Chamada aberta demais (ex.: string sem aspas finais): descarta
+            # ate o primeiro "</args>" para as seguintes voltarem a sair cedo
+            close = self._pending.find(_ARGS_CLOSE)
+            if close >= 0:
+                self._pending = self._pending[close + len(_ARGS_CLOSE):]
+                more, pos = _scan_tool_calls(self._pending)
+                found += more
+                self._pending = self._pending[pos:]
+        self._in_call = _TOOL_OPEN in self._pending
+        return found
+
+    def finish(self) -> list[tuple[str, str]]:
+        """Fim da resposta: chamadas validas que estavam apos args sem fim"""
+        found, _ = _scan_tool_calls(self._pending, final=True)
+        self._pending = ""
+        self._in_call = False
+        return found
+
+
+def _format_tree(tree: dict) -> str:
+    """Formata arvore de get_file_tree (DFS iterativa em um unico buffer)"""
+    out = io.StringIO()
+    # (no, prefixo da linha, prefixo dos filhos)
+    stack = [(tree, "", "")]
+
+    while stack:
+        node, line_prefix, child_prefix = stack.pop()
+        if out.tell():
+            out.write("\n")
+        out.write(line_prefix)
+        out.write(node["name"])
+        if node.get("type") == "dir":
+            out.write("/")
+
+        children = node.get("children", [])
+        last = len(children) - 1
+        for i in range(last, -1, -1):
+            if i == last:
+                stack.append((children[i], child_prefix + "└── ", child_prefix + "    "))
+            else:
+                stack.append((children[i], child_prefix + "├── ", child_prefix + "│   "))
+
+    return out.getvalue()
+
+
+@dataclass(slots=True)
+class ToolCall:
     """Representacao de uma chamada de ferramenta"""
     name: str
     arguments: dict
 
 
-class ToolResult(BaseModel):
+@dataclass(slots=True)
+class ToolResult:
     """Resultado de uma ferramenta"""
     success: bool
     result: Any
     error: Optional[str] = None
+    # Resultado ja e a resposta final para o usuario (dispensa nova chamada ao LLM)
+    terminal: bool = False
 
 
-class ConversationMessage(BaseModel):
+@dataclass(slots=True)
+class ConversationMessage:
     """Mensagem na conversa"""
     role: str
     content: str
@@ -35,18 +315,8 @@ class ConversationMessage(BaseModel):
     tool_results: Optional[list[ToolResult]] = None
 
 
-class IAFOXAgent:
-    """
-    Agente principal do IAFOX
-
-    Combina:
-    - LLM (Ollama)
-    - Gerenciador de arquivos
-    - Sistema de ferramentas
-    """
-
-    # Definicao das ferramentas disponiveis
-    TOOLS_DESCRIPTION = """
+# Descricao das ferramentas anexada ao system prompt
+_TOOLS_DESCRIPTION = """
 ## Ferramentas Disponiveis
 
 Voce tem acesso as seguintes ferramentas. Use-as quando necessario:
@@ -171,6 +441,20 @@ FLUXO CORRETO:
 5. VOCE RESPONDE com as informacoes e links
 """
 
+
+class IAFOXAgent:
+    """
+    Agente principal do IAFOX
+
+    Combina:
+    - LLM (Ollama)
+    - Gerenciador de arquivos
+    - Sistema de ferramentas
+    """
+
+    # Definicao das ferramentas disponiveis
+    TOOLS_DESCRIPTION = _TOOLS_DESCRIPTION
+
     def __init__(
         self,
         llm: Optional[OllamaClient] = None,
@@ -179,9 +463,16 @@ FLUXO CORRETO:
     ):
         self.llm = llm or OllamaClient()
         self.file_manager = file_manager or FileManager()
+        self.summary: Optional[str] = None
         self.system_prompt = system_prompt or config.system_prompt
+        self.max_history_messages = config.max_history_messages
         self.conversation: list[ConversationMessage] = []
+        # Mensagens ja no formato do LLM, mantidas junto com conversation
+        self._llm_messages: list[Message] = []
         self.tools: dict[str, Callable] = {}
+        self._tool_semaphore = asyncio.Semaphore(config.max_tool_concurrency)
+        # Arvores ja formatadas: (path, max_depth) -> (versao, mtime_ns da raiz, expira_em, texto)
+        self._tree_cache: dict[tuple[str, int], tuple[int, int, float, str]] = {}
         self._register_default_tools()
 
     def _register_default_tools(self):
@@ -247,10 +538,12 @@ FLUXO CORRETO:
         """Ferramenta: listar arquivos"""
         try:
             files = await self.file_manager.list_directory(path, recursive, pattern)
-            result = "\n".join(
-                f"{'[DIR] ' if f.is_dir else '      '}{f.name}"
-                for f in files
-            )
+            buf = io.StringIO()
+            for f in files:
+                buf.write("[DIR] " if f.is_dir else "      ")
+                buf.write(f.name)
+                buf.write("\n")
+            result = buf.getvalue()[:-1]
             return ToolResult(success=True, result=result or "Diretorio vazio")
         except Exception as e:
             return ToolResult(success=False, result=None, error=str(e))
@@ -264,7 +557,11 @@ FLUXO CORRETO:
         """Ferramenta: buscar arquivos"""
         try:
             files = await self.file_manager.search_files(pattern, path, content_search)
-            result = "\n".join(f.path for f in files)
+            buf = io.StringIO()
+            for f in files:
+                buf.write(f.path)
+                buf.write("\n")
+            result = buf.getvalue()[:-1]
             return ToolResult(
                 success=True,
                 result=result or "Nenhum arquivo encontrado"
@@ -274,29 +571,65 @@ FLUXO CORRETO:
 
     async def _tool_execute_command(self, command: str) -> ToolResult:
         """Ferramenta: executar comando"""
-        import asyncio
-
         try:
             process = await asyncio.create_subprocess_shell(
                 command,
                 stdout=asyncio.subprocess.PIPE,
                 stderr=asyncio.subprocess.PIPE,
-                cwd=str(self.file_manager.workspace)
+                cwd=str(self.file_manager.workspace),
+                # Grupo proprio para o timeout matar tambem os filhos do shell
+                start_new_session=os.name == "posix"
             )
-            stdout, stderr = await process.communicate()
 
-            output = stdout.decode() if stdout else ""
-            errors = stderr.decode() if stderr else ""
+            # Le stdout/stderr em paralelo com memoria limitada
+            stdout_buf: deque = deque(maxlen=MAX_COMMAND_OUTPUT_LINES)
+            stderr_buf: deque = deque(maxlen=MAX_COMMAND_OUTPUT_LINES)
+
+            async def collect():
+                counts = await asyncio.gather(
+                    _drain_stream(process.stdout, stdout_buf),
+                    _drain_stream(process.stderr, stderr_buf)
+                )
+                await process.wait()
+                return counts
+
+            timed_out = False
+            try:
+                stdout_lines, stderr_lines = await asyncio.wait_for(
+                    collect(), timeout=config.command_timeout or None
+                )
+            except asyncio.TimeoutError:
+                # Mata o processo e fica com a saida lida ate aqui
+                timed_out = True
+                kill_process(process)
+                await process.wait()
+                stdout_lines, stderr_lines = len(stdout_buf), len(stderr_buf)
+            finally:
+                # Cancelado (Ctrl+C, requisicao abortada): nao deixa o comando rodando
+                if process.returncode is None:
+                    kill_process(process)
+                    await process.wait()
+
+            # O comando pode ter criado/removido arquivos
+            self._tree_cache.clear()
+
+            output = _format_stream_output(stdout_buf, stdout_lines)
+            errors = _format_stream_output(stderr_buf, stderr_lines)
 
             result = ""
             if output:
                 result += f"STDOUT:\n{output}\n"
             if errors:
                 result += f"STDERR:\n{errors}\n"
+            if timed_out:
+                result += (
+                    f"Tempo limite excedido ({config.command_timeout:g}s)"
+                    " - processo encerrado\n"
+                )
             result += f"Exit code: {process.returncode}"
 
             return ToolResult(
-                success=process.returncode == 0,
+                success=process.returncode == 0 and not timed_out,
                 result=result
             )
         except Exception as e:
@@ -309,45 +642,48 @@ FLUXO CORRETO:
     ) -> ToolResult:
         """Ferramenta: arvore de arquivos"""
         try:
-            tree = await self.file_manager.get_file_tree(path, max_depth)
-
-            def format_tree(node: dict, prefix: str = "") -> str:
-                lines = [f"{prefix}{node['name']}/"] if node.get("type") == "dir" else [f"{prefix}{node['name']}"]
-
-                children = node.get("children", [])
-                for i, child in enumerate(children):
-                    is_last = i == len(children) - 1
-                    child_prefix = prefix + ("    " if is_last else "│   ")
-                    connector = "└── " if is_last else "├── "
-                    child_lines = format_tree(child, child_prefix)
-                    lines.append(f"{prefix}{connector}{child_lines.split(prefix + '    ', 1)[-1] if child_prefix in child_lines else child_lines.lstrip()}")
-
-                return "\n".join(lines)
-
-            return ToolResult(success=True, result=format_tree(tree))
+            key = (path, max_depth)
+            # Versao do FileManager pega escritas feitas por fora do agente (API)
+            version = self.file_manager.version
+            root_mtime = os.stat(self.file_manager.workspace / path).st_mtime_ns
+            now = time.monotonic()
+            cached = self._tree_cache.get(key)
+            if cached and cached[:2] == (version, root_mtime) and now < cached[2]:
+                return ToolResult(success=True, result=cached[3], terminal=True)
+
+            tree = _format_tree(await self.file_manager.get_file_tree(path, max_depth))
+            self._tree_cache[key] = (version, root_mtime, now + TREE_CACHE_TTL, tree)
+            return ToolResult(success=True, result=tree, terminal=True)
         except Exception as e:
             return ToolResult(success=False, result=None, error=str(e))
 
     async def _tool_web_search(self, query: str, max_results: int = 10) -> ToolResult:
         """Ferramenta: busca na web"""
+        # Import tardio - duckduckgo_search so e carregado quando usado
+        from ..tools.web_search import buscar_web_async
+
         try:
-            result = buscar_web(query, max_results)
+            result = await buscar_web_async(query, max_results)
             return ToolResult(success=True, result=result)
         except Exception as e:
             return ToolResult(success=False, result=None, error=str(e))
 
     async def _tool_search_news(self, query: str, max_results: int = 10) -> ToolResult:
         """Ferramenta: busca noticias"""
+        from ..tools.web_search import buscar_noticias_async
+
         try:
-            result = buscar_noticias(query, max_results)
+            result = await buscar_noticias_async(query, max_results)
             return ToolResult(success=True, result=result)
         except Exception as e:
             return ToolResult(success=False, result=None, error=str(e))
 
     async def _tool_buscar_livros(self, query: str, materia: str = None, max_results: int = 5) -> ToolResult:
         """Ferramenta: busca nos livros do 8° ano"""
+        from ..tools.rag import buscar_nos_livros
+
         try:
-            result = buscar_nos_livros(query, materia, max_results)
+            result = await asyncio.to_thread(buscar_nos_livros, query, materia, max_results)
             return ToolResult(success=True, result=result)
         except Exception as e:
             return ToolResult(success=False, result=None, error=str(e))
@@ -361,6 +697,8 @@ FLUXO CORRETO:
         seed: int = -1
     ) -> ToolResult:
         """Ferramenta: gera imagens com FLUX.1"""
+        from ..tools.image.gerar_imagem import gerar_imagem
+
         try:
             result = await gerar_imagem(
                 prompt=prompt,
@@ -376,7 +714,7 @@ FLUXO CORRETO:
                 output += f"Resolucao: {result.get('largura')}x{result.get('altura')}\n"
                 if result.get("arquivo"):
                     output += f"Salva em: {result.get('arquivo')}\n"
-                return ToolResult(success=True, result=output)
+                return ToolResult(success=True, result=output, terminal=True)
             else:
                 error_msg = result.get("erro", "Erro desconhecido")
                 if result.get("instrucoes"):
@@ -387,31 +725,38 @@ FLUXO CORRETO:
 
     def _parse_tool_calls(self, text: str) -> list[ToolCall]:
         """Extrai chamadas de ferramentas do texto"""
-        pattern = r"<tool>(\w+)</tool><args>(.*?)</args>"
-        matches = re.findall(pattern, text, re.DOTALL)
+        # Maioria das respostas nao tem ferramentas - evita o scan
+        if _TOOL_OPEN not in text:
+            return []
 
+        return self._build_tool_calls(_scan_tool_calls(text, final=True)[0])
+
+    def _build_tool_calls(self, pairs: list[tuple[str, str]]) -> list[ToolCall]:
+        """Converte pares (nome, args JSON) em ToolCall, ignorando JSON invalido"""
         calls = []
-        for name, args_str in matches:
+        for name, args_str in pairs:
             try:
-                args = json.loads(args_str)
-                calls.append(ToolCall(name=name, arguments=args))
-            except json.JSONDecodeError:
+                args = json_loads(args_str)
+                # Nome internado: lookup no dict de ferramentas compara por identidade
+                calls.append(ToolCall(name=sys.intern(name), arguments=args))
+            except JSONDecodeError:
                 continue
 
         return calls
 
     async def _execute_tool(self, call: ToolCall) -> ToolResult:
         """Executa uma ferramenta"""
-        if call.name not in self.tools:
+        tool_fn = self.tools.get(call.name)
+        if tool_fn is None:
             return ToolResult(
                 success=False,
                 result=None,
                 error=f"Ferramenta desconhecida: {call.name}"
             )
 
-        tool_fn = self.tools[call.name]
         try:
-            return await tool_fn(**call.arguments)
+            async with self._tool_semaphore:
+                return await tool_fn(**call.arguments)
         except TypeError as e:
             return ToolResult(
                 success=False,
@@ -419,9 +764,116 @@ FLUXO CORRETO:
                 error=f"Argumentos invalidos: {e}"
             )
 
+    async def _execute_tools(
+        self,
+        calls: list[ToolCall],
+        started: Optional[dict[int, asyncio.Task]] = None
+    ) -> list[ToolResult]:
+        """
+        Executa ferramentas mantendo a ordem dos resultados
+
+        Chamadas consecutivas sem efeitos colaterais rodam em paralelo;
+        write_file, edit_file e execute_command rodam sozinhas, na ordem.
+
+        Args:
+            calls: Chamadas na ordem em que apareceram
+            started: Tasks ja disparadas durante o streaming (indice -> task)
+        """
+        started = started or {}
+        results: list[ToolResult] = []
+        batch: list[Awaitable[ToolResult]] = []
+
+        async def flush_batch():
+            if not batch:
+                return
+            batch_results = await asyncio.gather(*batch, return_exceptions=True)
+            for r in batch_results:
+                if isinstance(r, BaseException):
+                    r = ToolResult(success=False, result=None, error=str(r))
+                results.append(r)
+            batch.clear()
+
+        for i, call in enumerate(calls):
+            if i in started:
+                batch.append(started[i])
+                continue
+            if call.name in PARALLEL_SAFE_TOOLS:
+                batch.append(self._execute_tool(call))
+                continue
+            await flush_batch()
+            results.append(await self._execute_tool(call))
+        await flush_batch()
+
+        return results
+
+    def _append_message(self, message: ConversationMessage):
+        """Adiciona mensagem ao historico e a lista enviada ao LLM"""
+        self.conversation.append(message)
+        self._llm_messages.append(Message(role=message.role, content=message.content))
+
+    @property
+    def system_prompt(self) -> str:
+        """System prompt base do agente"""
+        return self._system_prompt
+
+    @system_prompt.setter
+    def system_prompt(self, value: str):
+        self._system_prompt = value
+        self._full_system_prompt = f"{value}\n\n{self.TOOLS_DESCRIPTION}"
+        self._set_summary(self.summary)
+
+    def _set_summary(self, summary: Optional[str]):
+        """Define resumo da conversa e remonta o system prompt"""
+        self.summary = summary
+        if summary:
+            self._prompt_with_summary = (
+                f"{self._full_system_prompt}\n\n"
+                f"## Resumo da conversa anterior\n{summary}"
+            )
+        else:
+            self._prompt_with_summary = self._full_system_prompt
+
     def _build_system_prompt(self) -> str:
-        """Constroi system prompt completo"""
-        return f"{self.system_prompt}\n\n{self.TOOLS_DESCRIPTION}"
+        """
+        Retorna system prompt completo (pre-montado no setter)
+
+        A string e identica entre chamadas, o que permite ao Ollama reusar o
+        prefixo em cache. Alterar system_prompt ou o resumo invalida esse cache.
+        """
+        return self._prompt_with_summary
+
+    async def _compact_history(self):
+        """
+        Resume as mensagens mais antigas quando o historico passa do limite
+
+        Mantem as ultimas mensagens intactas e substitui as demais por um
+        resumo que vai no system prompt, limitando o tamanho do prompt.
+        """
+        limit = self.max_history_messages
+        if limit <= 0 or len(self.conversation) <= limit:
+            return
+
+        keep = max(limit // 2, 1)
+        old_messages = self._llm_messages[:-keep]
+
+        request = "Resuma a conversa acima em no maximo 300 palavras, "
+        request += "mantendo fatos, decisoes, arquivos e codigo relevantes."
+        if self.summary:
+            request += f"\n\nResumo anterior (incorpore-o):\n{self.summary}"
+
+        try:
+            summary = await self.llm.chat(
+                messages=[*old_messages, Message(role="user", content=request)],
+                system="Voce resume conversas de forma objetiva, em portugues.",
+                stream=False
+            )
+        except Exception:
+            # Sem resumo nao descarta historico; tenta de novo no proximo turno
+            return
+
+        self.conversation = self.conversation[-keep:]
+        self._llm_messages = self._llm_messages[-keep:]
+        self._set_summary(summary)
 
     async def chat(
         self,
@@ -438,58 +890,90 @@ FLUXO CORRETO:
         Yields:
             Chunks da resposta
         """
-        # Adiciona mensagem do usuario
-        self.conversation.append(ConversationMessage(
-            role="user",
-            content=user_message
-        ))
-
-        # Prepara mensagens para o LLM
-        messages = [
-            Message(role=msg.role, content=msg.content)
-            for msg in self.conversation
-        ]
-
-        # Gera resposta
-        full_response = ""
-
-        if stream:
-            gen = await self.llm.chat(
-                messages=messages,
-                system=self._build_system_prompt(),
-                stream=True
-            )
-            async for chunk in gen:
-                full_response += chunk
-                yield chunk
-        else:
-            full_response = await self.llm.chat(
-                messages=messages,
-                system=self._build_system_prompt(),
-                stream=False
-            )
-            yield full_response
+        message = user_message
 
-        # Verifica se ha chamadas de ferramentas
-        tool_calls = self._parse_tool_calls(full_response)
+        while True:
+            # Adiciona mensagem do usuario
+            self._append_message(ConversationMessage(
+                role="user",
+                content=message
+            ))
+            await self._compact_history()
+
+            # Ferramentas disparadas antes do fim da resposta (indice -> task)
+            started: dict[int, asyncio.Task] = {}
+
+            # Gera resposta
+            if stream:
+                gen = await self.llm.chat(
+                    messages=self._llm_messages,
+                    system=self._build_system_prompt(),
+                    stream=True
+                )
+                parts: list[str] = []
+                tool_calls: list[ToolCall] = []
+                scanner = _ToolCallStream()
+                # So dispara cedo enquanto nenhuma ferramenta com efeitos apareceu
+                can_start = True
+                try:
+                    async for chunk in gen:
+                        parts.append(chunk)
+                        yield chunk
+
+                        # Executa ferramentas enquanto o modelo ainda gera
+                        for call in self._build_tool_calls(scanner.feed(chunk)):
+                            if can_start and call.name in PARALLEL_SAFE_TOOLS:
+                                started[len(tool_calls)] = asyncio.create_task(
+                                    self._execute_tool(call)
+                                )
+                            else:
+                                can_start = False
+                            tool_calls.append(call)
+                except BaseException:
+                    for task in started.values():
+                        task.cancel()
+                    raise
+                tool_calls += self._build_tool_calls(scanner.finish())
+                full_response = "".join(parts)
+            else:
+                full_response = await self.llm.chat(
+                    messages=self._llm_messages,
+                    system=self._build_system_prompt(),
+                    stream=False
+                )
+                yield full_response
+
+                # Verifica se ha chamadas de ferramentas
+                tool_calls = self._parse_tool_calls(full_response)
+
+            if not tool_calls:
+                # Adiciona resposta do assistente
+                self._append_message(ConversationMessage(
+                    role="assistant",
+                    content=full_response
+                ))
+                return
 
-        if tool_calls:
             # Adiciona resposta do assistente
-            self.conversation.append(ConversationMessage(
+            self._append_message(ConversationMessage(
                 role="assistant",
                 content=full_response,
                 tool_calls=tool_calls
             ))
 
             # Executa ferramentas
-            results = []
             for call in tool_calls:
                 yield f"\n\n[Executando {call.name}...]\n"
-                result = await self._execute_tool(call)
-                results.append(result)
 
+            results = await self._execute_tools(tool_calls, started)
+            all_terminal = all(r.terminal for r in results)
+
+            for result in results:
                 if result.success:
-                    yield f"[Resultado: {result.result[:500]}{'...' if len(str(result.result)) > 500 else ''}]\n"
+                    text = result.result if isinstance(result.result, str) else repr(result.result)
+                    if not all_terminal:
+                        text = text[:500] + ("..." if len(text) > 500 else "")
+                    yield f"[Resultado: {text}]\n"
                 else:
                     yield f"[Erro: {result.error}]\n"
 
@@ -499,24 +983,31 @@ FLUXO CORRETO:
                 for call, r in zip(tool_calls, results)
             )
 
-            self.conversation.append(ConversationMessage(
+            if all_terminal:
+                # Resultados ja respondem o usuario - encerra sem nova geracao
+                self._append_message(ConversationMessage(
+                    role="assistant",
+                    content=f"[Resultados das ferramentas]\n{results_text}"
+                ))
+                return
+
+            self._append_message(ConversationMessage(
                 role="user",
                 content=f"[Resultados das ferramentas]\n{results_text}"
             ))
 
             # Continua a conversa com os resultados
-            async for chunk in self.chat("Continue com base nos resultados das ferramentas.", stream=stream):
-                yield chunk
-        else:
-            # Adiciona resposta do assistente
-            self.conversation.append(ConversationMessage(
-                role="assistant",
-                content=full_response
-            ))
+            message = "Continue com base nos resultados das ferramentas."
+
+    async def chat_full(self, user_message: str) -> str:
+        """Processa mensagem sem streaming e retorna a resposta completa"""
+        return "".join([chunk async for chunk in self.chat(user_message, stream=False)])
 
     def clear_conversation(self):
         """Limpa historico de conversa"""
         self.conversation = []
+        self._llm_messages = []
+        self._set_summary(None)
 
     def get_conversation_history(self) -> list[dict]:
         """Retorna historico formatado"""
@@ -2,23 +2,30 @@
 Configuracoes do IAFOX
 """
 
+import functools
 from pathlib import Path
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from typing import Optional
 import os
-import json
+
+from ..utils.serialization import json_loads
 
 
 class OllamaConfig(BaseModel):
     """Configuracoes do Ollama"""
+    model_config = ConfigDict(defer_build=True)
+
     host: str = Field(default="http://localhost:11434", description="URL do servidor Ollama")
     model: str = Field(default="qwen3-coder:30b", description="Melhor modelo de codigo para RTX 4090")
     timeout: int = Field(default=300, description="Timeout em segundos")
+    keep_alive: str = Field(default="30m", description="Tempo que o modelo fica carregado apos uso")
 
 
 class FilesConfig(BaseModel):
     """Configuracoes de gerenciamento de arquivos"""
-    workspace: Path = Field(default=Path.cwd(), description="Diretorio de trabalho")
+    model_config = ConfigDict(defer_build=True)
+
+    workspace: Path = Field(default_factory=Path.cwd, description="Diretorio de trabalho")
     allowed_extensions: list[str] = Field(
         default=[
             ".py", ".js", ".ts", ".jsx", ".tsx", ".cs", ".java", ".go", ".rs",
@@ -37,6 +44,8 @@ class FilesConfig(BaseModel):
 
 class RAGConfig(BaseModel):
     """Configuracoes do sistema RAG"""
+    model_config = ConfigDict(defer_build=True)
+
     enabled: bool = Field(default=True, description="RAG habilitado")
     chroma_path: Path = Field(default=Path("./data/chroma"), description="Caminho do ChromaDB")
     embedding_model: str = Field(default="all-MiniLM-L6-v2", description="Modelo de embeddings")
@@ -47,6 +56,8 @@ class RAGConfig(BaseModel):
 
 class WebConfig(BaseModel):
     """Configuracoes da interface web"""
+    model_config = ConfigDict(defer_build=True)
+
     host: str = Field(default="0.0.0.0", description="Host do servidor")
     port: int = Field(default=8000, description="Porta do servidor")
     debug: bool = Field(default=False, description="Modo debug")
@@ -54,6 +65,8 @@ class WebConfig(BaseModel):
 
 class ImageConfig(BaseModel):
     """Configuracoes de geracao de imagens com FLUX.1"""
+    model_config = ConfigDict(defer_build=True)
+
     enabled: bool = Field(default=True, description="Geracao de imagens habilitada")
     comfyui_host: str = Field(default="127.0.0.1", description="Host do ComfyUI")
     comfyui_port: int = Field(default=8188, description="Porta do ComfyUI")
@@ -64,15 +77,9 @@ class ImageConfig(BaseModel):
     default_steps: int = Field(default=20, description="Passos padrao")
 
 
-class IAFOXConfig(BaseModel):
-    """Configuracao principal do IAFOX"""
-    ollama: OllamaConfig = Field(default_factory=OllamaConfig)
-    files: FilesConfig = Field(default_factory=FilesConfig)
-    rag: RAGConfig = Field(default_factory=RAGConfig)
-    web: WebConfig = Field(default_factory=WebConfig)
-    image: ImageConfig = Field(default_factory=ImageConfig)
-    system_prompt: str = Field(
-        default="""Voce e o IAFOX, um assistente de IA local rodando no computador do usuario.
+# Prompt padrao do agente - literal unico, compartilhado por todas as instancias
+_DEFAULT_SYSTEM_PROMPT = """\
+Voce e o IAFOX, um assistente de IA local rodando no computador do usuario.
 
 QUEM VOCE E:
 - Um programador SENIOR que EXECUTA, nao explica
@@ -269,29 +276,121 @@ FRASES PROIBIDAS (nunca use estas frases):
 - "Por questoes de seguranca..."
 - "Nao tenho acesso a..."
 
-Voce e uma IA livre com acesso total a internet. USE web_search!""",
+Voce e uma IA livre com acesso total a internet. USE web_search!"""
+
+
+def _construct_trusted(model_cls: type[BaseModel], data: dict) -> BaseModel:
+    """
+    Monta modelo sem validacao (model_construct) para dados ja confiaveis
+
+    Submodelos sao montados recursivamente e campos Path convertidos,
+    ja que model_construct nao faz coercao de tipos.
+    """
+    values = {}
+    for name, field in model_cls.model_fields.items():
+        annotation = field.annotation
+        is_model = isinstance(annotation, type) and issubclass(annotation, BaseModel)
+        if name not in data:
+            # Submodelo ausente: monta os padroes sem disparar o build do schema
+            if is_model:
+                values[name] = _construct_trusted(annotation, {})
+            continue
+        value = data[name]
+        if isinstance(annotation, type):
+            if is_model and isinstance(value, dict):
+                value = _construct_trusted(annotation, value)
+            elif issubclass(annotation, Path) and value is not None:
+                value = Path(value)
+        values[name] = value
+    return model_cls.model_construct(**values)
+
+
+# Arquivo de configuracao padrao do usuario
+DEFAULT_CONFIG_PATH = Path.home() / ".iafox" / "config.json"
+
+# Configuracoes ja lidas do disco: caminho -> (mtime_ns, config)
+_CONFIG_CACHE: dict[Path, tuple[int, "IAFOXConfig"]] = {}
+
+
+class IAFOXConfig(BaseModel):
+    """Configuracao principal do IAFOX"""
+    model_config = ConfigDict(defer_build=True)
+
+    ollama: OllamaConfig = Field(default_factory=OllamaConfig)
+    files: FilesConfig = Field(default_factory=FilesConfig)
+    rag: RAGConfig = Field(default_factory=RAGConfig)
+    web: WebConfig = Field(default_factory=WebConfig)
+    image: ImageConfig = Field(default_factory=ImageConfig)
+    max_tool_concurrency: int = Field(default=4, description="Ferramentas executadas em paralelo")
+    max_history_messages: int = Field(
+        default=40,
+        description="Mensagens no historico antes de resumir as antigas (0 = sem limite)"
+    )
+    search_cache_ttl: float = Field(
+        default=300.0,
+        description="Segundos que resultados de busca web ficam em cache (0 = desativado)"
+    )
+    search_proxies: list[str] = Field(
+        default_factory=list,
+        description="Proxies para a busca web, trocados em rodizio apos rate limit"
+    )
+    command_timeout: float = Field(
+        default=300.0,
+        description="Tempo maximo (s) de um comando no terminal (0 = sem limite)"
+    )
+    max_parallel_commands: int = Field(
+        default=4,
+        description="Comandos executados em paralelo via API (/api/execute)"
+    )
+    system_prompt: str = Field(
+        default=_DEFAULT_SYSTEM_PROMPT,
         description="System prompt do agente"
     )
 
     @classmethod
-    def load(cls, path: Optional[Path] = None) -> "IAFOXConfig":
-        """Carrega configuracao de arquivo ou usa padrao"""
+    def load(cls, path: Optional[Path] = None, validate: bool = False) -> "IAFOXConfig":
+        """
+        Carrega configuracao de arquivo ou usa padrao
+
+        Args:
+            path: Arquivo de configuracao (padrao: ~/.iafox/config.json)
+            validate: Valida com Pydantic em vez de confiar no arquivo salvo
+        """
         if path is None:
-            path = Path.home() / ".iafox" / "config.json"
-        if path.exists():
-            with open(path) as f:
-                data = json.load(f)
-            return cls(**data)
-        return cls()
+            path = DEFAULT_CONFIG_PATH
+        try:
+            mtime = path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return cls()
+
+        # Arquivo nao mudou - reaproveita sem reler nem revalidar
+        cached = _CONFIG_CACHE.get(path)
+        if cached and cached[0] == mtime and type(cached[1]) is cls and not validate:
+            return cached[1].model_copy(deep=True)
+
+        raw = path.read_bytes()
+        if validate:
+            # Parse e validacao numa unica passada no pydantic-core
+            loaded = cls.model_validate_json(raw)
+        else:
+            loaded = _construct_trusted(cls, json_loads(raw))
+        _CONFIG_CACHE[path] = (mtime, loaded)
+        return loaded.model_copy(deep=True)
 
     def save(self, path: Optional[Path] = None) -> None:
         """Salva configuracao em arquivo"""
         if path is None:
-            path = Path.home() / ".iafox" / "config.json"
+            path = DEFAULT_CONFIG_PATH
         path.parent.mkdir(parents=True, exist_ok=True)
-        with open(path, "w") as f:
-            json.dump(self.model_dump(mode="json"), f, indent=2, default=str)
+        # Serializa direto no pydantic-core em bytes UTF-8, sem dict nem str intermediarios
+        path.write_bytes(self.__pydantic_serializer__.to_json(self, indent=2))
+
+
+@functools.lru_cache(maxsize=1)
+def _default_config() -> IAFOXConfig:
+    """Configuracao padrao, montada uma vez sem passar pela validacao"""
+    return _construct_trusted(IAFOXConfig, {})
 
 
 # Instancia global de configuracao
-config = IAFOXConfig()
+config = _default_config()
@@ -4,9 +4,13 @@ Gerenciador de arquivos - Ler, criar, editar arquivos
 
 import os
 import asyncio
+import fnmatch
+import functools
+import re
+from collections import deque
+from itertools import islice
 from pathlib import Path
-from typing import Optional
-import aiofiles
+from typing import AsyncIterator, Callable, Iterator, Optional
 from pydantic import BaseModel
 from ..core.config import config
 
@@ -29,34 +33,106 @@ class FileContent(BaseModel):
     lines: int
 
 
+@functools.lru_cache(maxsize=4096)
+def _resolve_cached(workspace: str, path: str) -> Path:
+    """Resolve caminho relativo ao workspace (cacheado - resolve() faz syscalls)"""
+    p = Path(path)
+    if not p.is_absolute():
+        p = Path(workspace) / p
+    return p.resolve()
+
+
+def _compile_glob(pattern: str) -> Callable[[str], bool]:
+    """Compila padrao glob uma vez (mesma semantica de fnmatch.fnmatch)"""
+    if pattern == "*":
+        return lambda name: True
+    match = re.compile(fnmatch.translate(os.path.normcase(pattern))).match
+    if os.path.normcase("A") == "A":
+        return lambda name: match(name) is not None
+    # Windows: comparacao sem diferenciar maiusculas
+    return lambda name: match(os.path.normcase(name)) is not None
+
+
+def _read_text(path: Path) -> tuple[str, str]:
+    """Le arquivo inteiro como texto (utf-8, com fallback latin-1)"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read(), "utf-8"
+    except UnicodeDecodeError:
+        with open(path, "r", encoding="latin-1") as f:
+            return f.read(), "latin-1"
+
+
+# Tabela bytes -> minusculas ASCII (bytes.translate roda em C)
+_ASCII_LOWER = bytes.maketrans(
+    bytes(range(ord("A"), ord("Z") + 1)),
+    bytes(range(ord("a"), ord("z") + 1))
+)
+
+# Tamanho do bloco lido na busca por conteudo
+SEARCH_CHUNK_SIZE = 64 * 1024
+
+# Arquivos varridos em paralelo na busca por conteudo
+SEARCH_CONCURRENCY = 32
+
+
+def _file_contains(path: Path, needle: bytes) -> bool:
+    """Busca needle (ASCII minusculo) no arquivo em blocos, sem carregar tudo"""
+    carry = b""
+    keep = len(needle) - 1
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(SEARCH_CHUNK_SIZE)
+            if not block:
+                return False
+            window = carry + block.translate(_ASCII_LOWER)
+            if needle in window:
+                return True
+            carry = window[-keep:] if keep else b""
+
+
+def _write_text(path: Path, content: str, mode: str = "w") -> None:
+    """Escreve (ou anexa) texto utf-8, criando diretorios pais"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, mode, encoding="utf-8") as f:
+        f.write(content)
+
+
+def _written_content(path: Path, content: str) -> FileContent:
+    """FileContent de um texto que acabou de ser gravado (utf-8)"""
+    return FileContent(
+        path=str(path),
+        content=content,
+        lines=content.count("\n") + 1
+    )
+
+
 class FileManager:
     """Gerenciador de operacoes com arquivos"""
 
     def __init__(self, workspace: Optional[Path] = None):
         self.workspace = workspace or config.files.workspace
-        self.allowed_extensions = config.files.allowed_extensions
+        # frozenset: testes de pertinencia O(1) a cada arquivo/componente
+        self.allowed_extensions = frozenset(e.lower() for e in config.files.allowed_extensions)
         self.max_file_size = config.files.max_file_size
-        self.excluded_dirs = config.files.excluded_dirs
+        self.excluded_dirs = frozenset(config.files.excluded_dirs)
+        # Incrementado a cada alteracao feita por este gerenciador (invalida caches)
+        self.version = 0
 
     def _resolve_path(self, path: str | Path) -> Path:
         """Resolve caminho relativo para absoluto"""
-        p = Path(path)
-        if not p.is_absolute():
-            p = self.workspace / p
-        return p.resolve()
+        return _resolve_cached(str(self.workspace), str(path))
 
     def _is_allowed(self, path: Path) -> bool:
         """Verifica se arquivo pode ser acessado"""
-        # Verifica extensao
-        if path.suffix.lower() not in self.allowed_extensions:
-            # Permite arquivos sem extensao se for texto
-            if path.suffix:
-                return False
+        # Verifica extensao (permite arquivos sem extensao se for texto)
+        suffix = path.suffix
+        if suffix and suffix.lower() not in self.allowed_extensions:
+            return False
 
         # Verifica se esta em diretorio excluido
-        for part in path.parts:
-            if part in self.excluded_dirs:
-                return False
+        if not self.excluded_dirs.isdisjoint(path.parts):
+            return False
 
         return True
 
@@ -64,10 +140,42 @@ class FileManager:
         """Verifica se diretorio deve ser excluido"""
         return path.name in self.excluded_dirs
 
+    def _walk_files(self, root: Path, pattern: str = "*") -> Iterator[Path]:
+        """
+        Percorre arquivos abaixo de root (como rglob), sem descer
+        em diretorios excluidos
+        """
+        excluded = self.excluded_dirs
+        # Padrao com "/" casa o final do caminho, como no rglob
+        match_path = "/" in pattern or os.sep in pattern
+        name_matches = _compile_glob(pattern)
+        stack = [str(root)]
+
+        while stack:
+            try:
+                with os.scandir(stack.pop()) as it:
+                    entries = list(it)
+            except (PermissionError, FileNotFoundError, NotADirectoryError):
+                continue
+
+            for entry in entries:
+                if entry.name in excluded:
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file():
+                    if match_path:
+                        if Path(entry.path).match(pattern):
+                            yield Path(entry.path)
+                    elif name_matches(entry.name):
+                        yield Path(entry.path)
+
     async def read_file(self, path: str | Path) -> FileContent:
         """Le conteudo de um arquivo"""
-        full_path = self._resolve_path(path)
+        return await self._read_resolved(self._resolve_path(path), path)
 
+    async def _read_resolved(self, full_path: Path, path: str | Path) -> FileContent:
+        """Le arquivo ja resolvido (path so aparece nas mensagens de erro)"""
         if not full_path.exists():
             raise FileNotFoundError(f"Arquivo nao encontrado: {path}")
 
@@ -79,18 +187,13 @@ class FileManager:
         if size > self.max_file_size:
             raise ValueError(f"Arquivo muito grande: {size} bytes (max: {self.max_file_size})")
 
-        # Tenta ler como texto
-        try:
-            async with aiofiles.open(full_path, "r", encoding="utf-8") as f:
-                content = await f.read()
-        except UnicodeDecodeError:
-            # Tenta latin-1 como fallback
-            async with aiofiles.open(full_path, "r", encoding="latin-1") as f:
-                content = await f.read()
+        # Abre, le e decodifica numa unica ida ao thread pool
+        content, encoding = await asyncio.to_thread(_read_text, full_path)
 
         return FileContent(
             path=str(full_path),
             content=content,
+            encoding=encoding,
             lines=content.count("\n") + 1
         )
 
@@ -98,11 +201,8 @@ class FileManager:
         """Escreve conteudo em arquivo (cria ou sobrescreve)"""
         full_path = self._resolve_path(path)
 
-        # Cria diretorio pai se nao existir
-        full_path.parent.mkdir(parents=True, exist_ok=True)
-
-        async with aiofiles.open(full_path, "w", encoding="utf-8") as f:
-            await f.write(content)
+        await asyncio.to_thread(_write_text, full_path, content)
+        self.version += 1
 
         return self._get_file_info(full_path)
 
@@ -121,13 +221,14 @@ class FileManager:
 
         if not full_path.exists():
             if create_if_missing:
-                await self.write_file(path, new_content)
-                return await self.read_file(path)
+                await asyncio.to_thread(_write_text, full_path, new_content)
+                self.version += 1
+                return _written_content(full_path, new_content)
             else:
                 raise FileNotFoundError(f"Arquivo nao encontrado: {path}")
 
         # Le conteudo atual
-        current = await self.read_file(path)
+        current = await self._read_resolved(full_path, path)
 
         # Verifica se old_content existe
         if old_content not in current.content:
@@ -139,17 +240,18 @@ class FileManager:
         # Substitui
         new_file_content = current.content.replace(old_content, new_content, 1)
 
-        # Salva
-        await self.write_file(path, new_file_content)
+        # Salva - o conteudo novo ja esta em memoria, sem reler o arquivo
+        await asyncio.to_thread(_write_text, full_path, new_file_content)
+        self.version += 1
 
-        return await self.read_file(path)
+        return _written_content(full_path, new_file_content)
 
     async def append_file(self, path: str | Path, content: str) -> FileContent:
         """Adiciona conteudo ao final do arquivo"""
         full_path = self._resolve_path(path)
 
-        async with aiofiles.open(full_path, "a", encoding="utf-8") as f:
-            await f.write(content)
+        await asyncio.to_thread(_write_text, full_path, content, "a")
+        self.version += 1
 
         return await self.read_file(path)
 
@@ -165,6 +267,7 @@ class FileManager:
             shutil.rmtree(full_path)
         else:
             full_path.unlink()
+        self.version += 1
 
         return True
 
@@ -172,6 +275,7 @@ class FileManager:
         """Cria diretorio"""
         full_path = self._resolve_path(path)
         full_path.mkdir(parents=True, exist_ok=True)
+        self.version += 1
         return self._get_file_info(full_path)
 
     def _get_file_info(self, path: Path) -> FileInfo:
@@ -193,6 +297,16 @@ class FileManager:
         pattern: Optional[str] = None
     ) -> list[FileInfo]:
         """Lista arquivos em diretorio"""
+        # Varredura (recursiva) e stats em thread: nao trava o event loop
+        return await asyncio.to_thread(self._list_directory, path, recursive, pattern)
+
+    def _list_directory(
+        self,
+        path: str | Path,
+        recursive: bool,
+        pattern: Optional[str]
+    ) -> list[FileInfo]:
+        """Implementacao sincrona de list_directory"""
         full_path = self._resolve_path(path)
 
         if not full_path.exists():
@@ -201,28 +315,26 @@ class FileManager:
         if not full_path.is_dir():
             raise ValueError(f"Nao e um diretorio: {path}")
 
-        files = []
+        get_info = self._get_file_info
 
         if recursive:
-            for item in full_path.rglob(pattern or "*"):
-                # Pula diretorios excluidos
-                skip = False
-                for part in item.relative_to(full_path).parts:
-                    if part in self.excluded_dirs:
-                        skip = True
-                        break
-                if skip:
-                    continue
-
-                if item.is_file():
-                    files.append(self._get_file_info(item))
+            files = [get_info(item) for item in self._walk_files(full_path, pattern or "*")]
         else:
-            for item in full_path.iterdir():
-                if self._should_exclude_dir(item):
-                    continue
-                if pattern and not item.match(pattern):
-                    continue
-                files.append(self._get_file_info(item))
+            excluded = self.excluded_dirs
+            if pattern and "/" not in pattern and os.sep not in pattern:
+                # Padrao so de nome: compila uma vez em vez de Path.match por item
+                name_matches = _compile_glob(pattern)
+
+                def matches(item: Path) -> bool:
+                    return name_matches(item.name)
+            else:
+                def matches(item: Path) -> bool:
+                    return not pattern or item.match(pattern)
+            files = [
+                get_info(item)
+                for item in full_path.iterdir()
+                if item.name not in excluded and matches(item)
+            ]
 
         return sorted(files, key=lambda f: (not f.is_dir, f.name.lower()))
 
@@ -233,34 +345,75 @@ class FileManager:
         content_search: Optional[str] = None
     ) -> list[FileInfo]:
         """Busca arquivos por nome ou conteudo"""
+        results = await self.iter_search_files(pattern, path, content_search)
+        return [info async for info in results]
+
+    async def iter_search_files(
+        self,
+        pattern: str,
+        path: str | Path = ".",
+        content_search: Optional[str] = None
+    ) -> AsyncIterator[FileInfo]:
+        """Como search_files, mas retorna iterador que entrega cada resultado assim que sai"""
         full_path = self._resolve_path(path)
-        results = []
-
-        for item in full_path.rglob(pattern):
-            # Pula diretorios excluidos
-            skip = False
-            for part in item.relative_to(full_path).parts:
-                if part in self.excluded_dirs:
-                    skip = True
-                    break
-            if skip:
-                continue
 
-            if not item.is_file():
-                continue
+        # Percorre a arvore fora do event loop
+        candidates = await asyncio.to_thread(
+            lambda: list(self._walk_files(full_path, pattern))
+        )
+        return self._iter_matches(candidates, content_search)
 
-            # Se busca por conteudo
-            if content_search:
-                try:
-                    file_content = await self.read_file(item)
-                    if content_search.lower() not in file_content.content.lower():
-                        continue
-                except:
-                    continue
+    async def _iter_matches(
+        self,
+        candidates: list[Path],
+        content_search: Optional[str]
+    ) -> AsyncIterator[FileInfo]:
+        """Filtra candidatos pelo conteudo em paralelo, entregando na ordem da arvore"""
+        get_info = self._get_file_info
+        if not content_search:
+            for item in candidates:
+                yield get_info(item)
+            return
+
+        needle = content_search.lower()
+        # Busca ASCII em linha unica: varre bytes em blocos sem decodificar o arquivo
+        byte_needle = (
+            needle.encode("ascii")
+            if needle.isascii() and "\n" not in needle and "\r" not in needle
+            else None
+        )
+        max_size = self.max_file_size
 
-            results.append(self._get_file_info(item))
+        def contains_bytes(item: Path) -> bool:
+            if item.stat().st_size > max_size:
+                return False
+            return _file_contains(item, byte_needle)
+
+        async def matches(item: Path) -> bool:
+            try:
+                if byte_needle:
+                    return await asyncio.to_thread(contains_bytes, item)
+                file_content = await self.read_file(item)
+                return needle in file_content.content.lower()
+            except Exception:
+                return False
 
-        return results
+        # Janela deslizante de ate SEARCH_CONCURRENCY buscas em andamento;
+        # entrega cada candidato quando os anteriores ja sairam
+        window: deque[tuple[Path, asyncio.Future]] = deque()
+        pending = iter(candidates)
+        try:
+            while True:
+                for item in islice(pending, SEARCH_CONCURRENCY - len(window)):
+                    window.append((item, asyncio.ensure_future(matches(item))))
+                if not window:
+                    break
+                item, task = window.popleft()
+                if await task:
+                    yield get_info(item)
+        finally:
+            for _, task in window:
+                task.cancel()
 
     async def get_file_tree(
         self,
@@ -268,32 +421,47 @@ class FileManager:
         max_depth: int = 3
     ) -> dict:
         """Retorna arvore de arquivos"""
+        return await asyncio.to_thread(self._file_tree, path, max_depth)
+
+    def _file_tree(self, path: str | Path, max_depth: int) -> dict:
+        """Implementacao sincrona de get_file_tree"""
         full_path = self._resolve_path(path)
+        excluded = self.excluded_dirs
+
+        # DFS iterativo: diretorios a expandir (no, caminho, profundidade)
+        stack: list[tuple[dict, str, int]] = []
 
-        def build_tree(p: Path, depth: int) -> dict:
+        def make_node(p: str, name: str, is_dir: bool, depth: int) -> dict:
             if depth > max_depth:
-                return {"name": p.name, "type": "dir", "truncated": True}
+                return {"name": name, "type": "dir", "truncated": True}
 
-            result = {
-                "name": p.name,
-                "path": str(p),
-                "type": "dir" if p.is_dir() else "file"
+            node = {
+                "name": name,
+                "path": p,
+                "type": "dir" if is_dir else "file"
             }
+            if is_dir and name not in excluded:
+                node["children"] = []
+                stack.append((node, p, depth))
+            return node
+
+        tree = make_node(str(full_path), full_path.name, full_path.is_dir(), 0)
+
+        while stack:
+            node, p, depth = stack.pop()
+            try:
+                # scandir traz o tipo de cada entrada sem stat extra
+                with os.scandir(p) as it:
+                    entries = [
+                        (e.path, e.name, e.is_dir())
+                        for e in it if e.name not in excluded
+                    ]
+            except PermissionError:
+                continue
+            entries.sort(key=lambda e: (not e[2], e[1].lower()))
+            node["children"] = [make_node(*e, depth + 1) for e in entries]
 
-            if p.is_dir() and not self._should_exclude_dir(p):
-                children = []
-                try:
-                    for item in sorted(p.iterdir(), key=lambda x: (x.is_file(), x.name.lower())):
-                        if self._should_exclude_dir(item):
-                            continue
-                        children.append(build_tree(item, depth + 1))
-                except PermissionError:
-                    pass
-                result["children"] = children
-
-            return result
-
-        return build_tree(full_path, 0)
+        return tree
 
 
 # Instancia global
@@ -3,10 +3,20 @@ Cliente para comunicacao com Ollama
 """
 
 import asyncio
+import socket
+import time
 from typing import AsyncGenerator, Optional
 import httpx
 from pydantic import BaseModel
 from ..core.config import config
+from ..utils.serialization import JSON_HEADERS, json_loads, json_dumpb
+
+# Import opcional - HTTP/2 (pacote h2) so vale para Ollama atras de proxy HTTPS
+try:
+    import h2  # noqa: F401
+    H2_AVAILABLE = True
+except ImportError:
+    H2_AVAILABLE = False
 
 
 class Message(BaseModel):
@@ -18,6 +28,9 @@ class Message(BaseModel):
 class OllamaClient:
     """Cliente para API do Ollama"""
 
+    # Tempo (s) que a lista de modelos fica em cache
+    MODELS_CACHE_TTL = 5.0
+
     def __init__(
         self,
         host: Optional[str] = None,
@@ -27,14 +40,30 @@ class OllamaClient:
         self.host = host or config.ollama.host
         self.model = model or config.ollama.model
         self.timeout = timeout or config.ollama.timeout
+        self.keep_alive = config.ollama.keep_alive
+        # Streaming: sem limite total, mas aborta se o servidor parar de enviar
+        self._stream_timeout = httpx.Timeout(None, connect=10.0, read=self.timeout)
         self._client: Optional[httpx.AsyncClient] = None
+        self._models_cache: Optional[tuple[float, list[dict]]] = None
 
     async def _get_client(self) -> httpx.AsyncClient:
         """Obtem cliente HTTP"""
         if self._client is None:
+            # TCP_NODELAY: tokens chegam em pacotes pequenos, sem esperar Nagle
+            # HTTP/2 so e negociado via TLS (ALPN); o Ollama local fala HTTP/1.1
+            transport = httpx.AsyncHTTPTransport(
+                http2=H2_AVAILABLE and self.host.startswith("https://"),
+                limits=httpx.Limits(
+                    max_connections=32,
+                    max_keepalive_connections=32,
+                    keepalive_expiry=60
+                ),
+                socket_options=[(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)]
+            )
             self._client = httpx.AsyncClient(
                 base_url=self.host,
-                timeout=httpx.Timeout(self.timeout)
+                timeout=httpx.Timeout(self.timeout),
+                transport=transport
             )
         return self._client
 
@@ -45,17 +74,23 @@ class OllamaClient:
             self._client = None
 
     async def list_models(self) -> list[dict]:
-        """Lista modelos disponiveis"""
+        """Lista modelos disponiveis (cache curto para evitar requests repetidos)"""
+        now = time.monotonic()
+        if self._models_cache and now - self._models_cache[0] < self.MODELS_CACHE_TTL:
+            return self._models_cache[1]
+
         client = await self._get_client()
         response = await client.get("/api/tags")
         response.raise_for_status()
-        return response.json().get("models", [])
+        models = response.json().get("models", [])
+        self._models_cache = (now, models)
+        return models
 
     async def check_model(self, model: Optional[str] = None) -> bool:
         """Verifica se modelo esta disponivel"""
         model = model or self.model
         models = await self.list_models()
-        return any(m.get("name", "").startswith(model.split(":")[0]) for m in models)
+        return model_in_list(model, {m.get("name", "") for m in models})
 
     async def pull_model(self, model: Optional[str] = None) -> AsyncGenerator[dict, None]:
         """Baixa modelo (streaming)"""
@@ -69,10 +104,10 @@ class OllamaClient:
             timeout=None  # Download pode demorar
         ) as response:
             response.raise_for_status()
-            async for line in response.aiter_lines():
-                if line:
-                    import json
-                    yield json.loads(line)
+            # Lista de modelos muda apos o download
+            self._models_cache = None
+            async for data in _iter_ndjson(response):
+                yield data
 
     async def chat(
         self,
@@ -99,16 +134,16 @@ class OllamaClient:
         client = await self._get_client()
 
         # Prepara mensagens
-        msgs = []
-        if system:
-            msgs.append({"role": "system", "content": system})
-        for msg in messages:
-            msgs.append({"role": msg.role, "content": msg.content})
+        msgs = [{"role": "system", "content": system}] if system else []
+        msgs += [{"role": msg.role, "content": msg.content} for msg in messages]
 
+        # keep_alive mantem o modelo carregado: com o mesmo system prompt
+        # (byte a byte) o Ollama reaproveita o prefixo ja processado
         payload = {
             "model": model,
             "messages": msgs,
             "stream": stream,
+            "keep_alive": self.keep_alive,
             "options": {
                 "temperature": temperature,
             }
@@ -117,7 +152,9 @@ class OllamaClient:
         if stream:
             return self._stream_chat(client, payload)
         else:
-            response = await client.post("/api/chat", json=payload)
+            response = await client.post(
+                "/api/chat", content=json_dumpb(payload), headers=JSON_HEADERS
+            )
             response.raise_for_status()
             return response.json()["message"]["content"]
 
@@ -127,20 +164,17 @@ class OllamaClient:
         payload: dict
     ) -> AsyncGenerator[str, None]:
         """Streaming de resposta"""
-        import json
-
         async with client.stream(
             "POST",
             "/api/chat",
-            json=payload,
-            timeout=None
+            content=json_dumpb(payload),
+            headers=JSON_HEADERS,
+            timeout=self._stream_timeout
         ) as response:
             response.raise_for_status()
-            async for line in response.aiter_lines():
-                if line:
-                    data = json.loads(line)
-                    if "message" in data and "content" in data["message"]:
-                        yield data["message"]["content"]
+            async for data in _iter_ndjson(response):
+                if "message" in data and "content" in data["message"]:
+                    yield data["message"]["content"]
 
     async def generate(
         self,
@@ -160,6 +194,7 @@ class OllamaClient:
             "model": model,
             "prompt": prompt,
             "stream": stream,
+            "keep_alive": self.keep_alive,
             "options": {
                 "temperature": temperature,
             }
@@ -171,7 +206,9 @@ class OllamaClient:
         if stream:
             return self._stream_generate(client, payload)
         else:
-            response = await client.post("/api/generate", json=payload)
+            response = await client.post(
+                "/api/generate", content=json_dumpb(payload), headers=JSON_HEADERS
+            )
             response.raise_for_status()
             return response.json()["response"]
 
@@ -181,20 +218,43 @@ class OllamaClient:
         payload: dict
     ) -> AsyncGenerator[str, None]:
         """Streaming de geracao"""
-        import json
-
         async with client.stream(
             "POST",
             "/api/generate",
-            json=payload,
-            timeout=None
+            content=json_dumpb(payload),
+            headers=JSON_HEADERS,
+            timeout=self._stream_timeout
         ) as response:
             response.raise_for_status()
-            async for line in response.aiter_lines():
-                if line:
-                    data = json.loads(line)
-                    if "response" in data:
-                        yield data["response"]
+            async for data in _iter_ndjson(response):
+                if "response" in data:
+                    yield data["response"]
+
+
+async def _iter_ndjson(response: httpx.Response) -> AsyncGenerator[dict, None]:
+    """Le resposta NDJSON em bytes, sem decodificar cada linha para str"""
+    buf = bytearray()
+    async for chunk in response.aiter_bytes():
+        buf += chunk
+        start = 0
+        while (nl := buf.find(b"\n", start)) >= 0:
+            line = bytes(buf[start:nl])
+            start = nl + 1
+            if line.strip():
+                yield json_loads(line)
+        del buf[:start]
+
+    if buf.strip():
+        yield json_loads(bytes(buf))
+
+
+def model_in_list(model: str, names: set[str]) -> bool:
+    """Verifica se modelo (ou outra tag do mesmo modelo) esta instalado"""
+    if model in names:
+        return True
+    model_base = model.split(":")[0]
+    prefix = model_base + ":"
+    return any(n == model_base or n.startswith(prefix) for n in names)
 
 
 # Instancia global
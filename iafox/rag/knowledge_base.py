@@ -27,6 +27,41 @@ except ImportError:
 
 from ..core.config import config
 
+# Arquivos lidos em paralelo por lote em add_directory
+READ_BATCH_SIZE = 32
+
+# Chunks por forward pass do modelo de embeddings
+EMBEDDING_BATCH_SIZE = 32
+
+# Chunks acumulados antes de cada gravacao no ChromaDB em add_directory
+STORE_BATCH_CHUNKS = 500
+
+
+# Modelos de embeddings ja carregados no processo (nome -> modelo)
+_EMBEDDER_CACHE: dict = {}
+
+
+def _get_embedder(model_name: str) -> "SentenceTransformer":
+    """Carrega modelo de embeddings uma vez por processo"""
+    embedder = _EMBEDDER_CACHE.get(model_name)
+    if embedder is None:
+        embedder = _EMBEDDER_CACHE[model_name] = SentenceTransformer(model_name)
+    return embedder
+
+
+def _read_file(path: Path) -> str:
+    """Le arquivo como texto, ignorando bytes invalidos"""
+    return path.read_text(encoding="utf-8", errors="ignore")
+
+
+def _file_metadata(path: Path) -> dict:
+    """Metadados padrao de um arquivo indexado"""
+    return {
+        "filename": path.name,
+        "extension": path.suffix,
+        "type": "file"
+    }
+
 
 class Document(BaseModel):
     """Representa um documento na base"""
@@ -93,12 +128,17 @@ class KnowledgeBase:
             )
 
         if self._embedder is None:
-            self._embedder = SentenceTransformer(self.embedding_model_name)
+            self._embedder = _get_embedder(self.embedding_model_name)
 
     def _generate_id(self, content: str, source: Optional[str] = None) -> str:
         """Gera ID unico para documento"""
-        text = f"{source or ''}{content}"
-        return hashlib.md5(text.encode()).hexdigest()
+        # Mesmo digest de md5(source + content), sem montar a string concatenada.
+        # Algoritmo mantido: IDs ja gravados no ChromaDB continuam validos
+        h = hashlib.md5(usedforsecurity=False)
+        if source:
+            h.update(source.encode())
+        h.update(content.encode())
+        return h.hexdigest()
 
     def _chunk_text(
         self,
@@ -155,18 +195,25 @@ class KnowledgeBase:
         """
         self._ensure_initialized()
 
-        # Divide em chunks
+        ids, chunks, metadatas = self._prepare_chunks(content, source, metadata)
+        await self._store_chunks(ids, chunks, metadatas)
+        return ids
+
+    def _prepare_chunks(
+        self,
+        content: str,
+        source: Optional[str] = None,
+        metadata: Optional[dict] = None
+    ) -> tuple[List[str], List[str], List[dict]]:
+        """Divide documento em chunks e monta IDs e metadados"""
         chunks = self._chunk_text(content)
 
         ids = []
-        documents = []
         metadatas = []
-        embeddings = []
 
         for i, chunk in enumerate(chunks):
             doc_id = self._generate_id(chunk, source)
             ids.append(doc_id)
-            documents.append(chunk)
 
             meta = {
                 "source": source or "unknown",
@@ -176,20 +223,31 @@ class KnowledgeBase:
             }
             metadatas.append(meta)
 
-            # Gera embedding
-            embedding = self._embedder.encode(chunk).tolist()
-            embeddings.append(embedding)
+        return ids, chunks, metadatas
+
+    async def _store_chunks(
+        self,
+        ids: List[str],
+        chunks: List[str],
+        metadatas: List[dict]
+    ) -> None:
+        """Gera embeddings e grava chunks no ChromaDB"""
+        # Gera embeddings de todos os chunks em lote, fora do event loop
+        embeddings = await asyncio.to_thread(
+            self._embedder.encode,
+            chunks,
+            batch_size=EMBEDDING_BATCH_SIZE,
+            show_progress_bar=False
+        )
 
         # Adiciona ao ChromaDB
         self._collection.add(
             ids=ids,
-            documents=documents,
+            documents=chunks,
             metadatas=metadatas,
-            embeddings=embeddings
+            embeddings=embeddings.tolist()
         )
 
-        return ids
-
     async def add_file(self, path: Path | str) -> List[str]:
         """Adiciona arquivo a base de conhecimento"""
         path = Path(path)
@@ -197,16 +255,12 @@ class KnowledgeBase:
         if not path.exists():
             raise FileNotFoundError(f"Arquivo nao encontrado: {path}")
 
-        content = path.read_text(encoding="utf-8", errors="ignore")
+        content = await asyncio.to_thread(_read_file, path)
 
         return await self.add_document(
             content=content,
             source=str(path),
-            metadata={
-                "filename": path.name,
-                "extension": path.suffix,
-                "type": "file"
-            }
+            metadata=_file_metadata(path)
         )
 
     async def add_directory(
@@ -226,14 +280,78 @@ class KnowledgeBase:
 
         glob_method = path.rglob if recursive else path.glob
 
-        for file_path in glob_method(pattern):
-            if file_path.is_file():
-                try:
-                    await self.add_file(file_path)
-                    count += 1
+        # Lista arquivos fora do event loop
+        files = await asyncio.to_thread(
+            lambda: [p for p in glob_method(pattern) if p.is_file()]
+        )
+
+        def read_batch(start: int):
+            """Le um lote de arquivos em paralelo no thread pool"""
+            return asyncio.gather(
+                *(asyncio.to_thread(_read_file, p) for p in files[start:start + READ_BATCH_SIZE]),
+                return_exceptions=True
+            )
+
+        # Chunks aguardando gravacao - acumulados entre lotes de leitura
+        # added: (arquivo, inicio, fim) dos seus chunks nas listas abaixo
+        added: list[tuple[Path, int, int]] = []
+        ids: list[str] = []
+        chunks: list[str] = []
+        metadatas: list[dict] = []
+
+        async def flush() -> int:
+            """Um encode e um add no ChromaDB para todos os chunks acumulados"""
+            if not added:
+                return 0
+            try:
+                self._ensure_initialized()
+                await self._store_chunks(ids, chunks, metadatas)
+                for file_path, _, _ in added:
                     print(f"Adicionado: {file_path}")
-                except Exception as e:
-                    print(f"Erro ao adicionar {file_path}: {e}")
+                return len(added)
+            except Exception:
+                # Lote falhou: grava arquivo a arquivo para so o culpado falhar
+                stored = 0
+                for file_path, start, end in added:
+                    try:
+                        await self._store_chunks(
+                            ids[start:end], chunks[start:end], metadatas[start:end]
+                        )
+                        print(f"Adicionado: {file_path}")
+                        stored += 1
+                    except Exception as e:
+                        print(f"Erro ao adicionar {file_path}: {e}")
+                return stored
+            finally:
+                added.clear()
+                ids.clear()
+                chunks.clear()
+                metadatas.clear()
+
+        # Enquanto um lote e indexado, o proximo ja esta sendo lido
+        pending = read_batch(0) if files else None
+        for start in range(0, len(files), READ_BATCH_SIZE):
+            batch = files[start:start + READ_BATCH_SIZE]
+            contents = await pending
+            next_start = start + READ_BATCH_SIZE
+            pending = read_batch(next_start) if next_start < len(files) else None
+
+            for file_path, content in zip(batch, contents):
+                if isinstance(content, Exception):
+                    print(f"Erro ao adicionar {file_path}: {content}")
+                    continue
+                file_ids, file_chunks, file_metas = self._prepare_chunks(
+                    content, str(file_path), _file_metadata(file_path)
+                )
+                added.append((file_path, len(ids), len(ids) + len(file_ids)))
+                ids += file_ids
+                chunks += file_chunks
+                metadatas += file_metas
+
+            if len(chunks) >= STORE_BATCH_CHUNKS:
+                count += await flush()
+
+        count += await flush()
 
         return count
 
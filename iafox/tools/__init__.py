@@ -2,6 +2,16 @@
 Ferramentas do IAFOX
 """
 
-from .web_search import buscar_web, buscar_noticias, buscar_imagens
+__all__ = [
+    "buscar_web", "buscar_noticias", "buscar_imagens",
+    "buscar_web_async", "buscar_noticias_async", "buscar_imagens_async",
+    "buscar_web_varios",
+]
 
-__all__ = ["buscar_web", "buscar_noticias", "buscar_imagens"]
+
+def __getattr__(name: str):
+    # Import tardio: evita carregar duckduckgo_search ao importar iafox.tools.*
+    if name in __all__:
+        from . import web_search
+        return getattr(web_search, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
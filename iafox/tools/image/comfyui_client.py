@@ -1,32 +1,126 @@
 """Cliente para comunicar com ComfyUI API"""
 import httpx
-import json
 import uuid
 import asyncio
+import logging
+import random
+import time
 import websockets
 from pathlib import Path
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Callable
 import base64
+from ...utils.serialization import JSON_HEADERS, json_loads, json_dumpb
+
+logger = logging.getLogger(__name__)
+
+# Tamanho do bloco no download de imagens
+IMAGE_CHUNK_SIZE = 64 * 1024
 
 
 class ComfyUIClient:
     """Cliente para interagir com ComfyUI via API"""
 
+    # Tempo (s) que o resultado de is_available fica em cache
+    AVAILABLE_CACHE_TTL = 5.0
+
     def __init__(self, host: str = "127.0.0.1", port: int = 8188):
         self.host = host
         self.port = port
         self.base_url = f"http://{host}:{port}"
         self.ws_url = f"ws://{host}:{port}/ws"
         self.client_id = str(uuid.uuid4())
+        self._http: Optional[httpx.AsyncClient] = None
+        self._avail_cache: Optional[tuple[float, bool]] = None
+        # WebSocket unico por cliente; mensagens sao despachadas por prompt_id
+        self._ws = None
+        self._ws_task: Optional[asyncio.Task] = None
+        self._ws_lock = asyncio.Lock()
+        self._pending: Dict[str, asyncio.Future] = {}
+        # Prompts que terminaram antes de alguem esperar por eles (prompt_id -> erro ou None)
+        self._finished: Dict[str, Optional[Exception]] = {}
+
+    def _get_http(self) -> httpx.AsyncClient:
+        """Obtem cliente HTTP (pool de conexoes reaproveitado entre chamadas)"""
+        if self._http is None:
+            self._http = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=httpx.Timeout(30.0, connect=5.0)
+            )
+        return self._http
+
+    async def aclose(self):
+        """Fecha conexoes HTTP e WebSocket"""
+        if self._ws_task:
+            self._ws_task.cancel()
+            self._ws_task = None
+        if self._ws:
+            await self._ws.close()
+            self._ws = None
+        if self._http:
+            await self._http.aclose()
+            self._http = None
+
+    async def _ensure_ws(self):
+        """Abre o WebSocket (uma vez) e inicia o despachante de mensagens"""
+        async with self._ws_lock:
+            if self._ws_task is None or self._ws_task.done():
+                # Servidor local: sem pings de keepalive da biblioteca
+                self._ws = await websockets.connect(
+                    f"{self.ws_url}?clientId={self.client_id}",
+                    ping_interval=None,
+                    max_queue=64
+                )
+                self._ws_task = asyncio.create_task(self._dispatch(self._ws))
+
+    async def _dispatch(self, ws):
+        """Le mensagens do WebSocket e resolve o future do prompt correspondente"""
+        try:
+            async for message in ws:
+                # Mensagens binarias sao previews de imagem
+                if isinstance(message, bytes):
+                    continue
+                data = json_loads(message)
+                kind = data.get("type")
+                exec_data = data.get("data", {})
+
+                if kind == "executing" and exec_data.get("node") is None:
+                    # Execucao completa
+                    result = None
+                elif kind == "execution_error":
+                    result = Exception(f"Erro ComfyUI: {exec_data}")
+                else:
+                    continue
+
+                prompt_id = exec_data.get("prompt_id")
+                future = self._pending.get(prompt_id)
+                if future is None:
+                    if len(self._finished) >= 64:
+                        self._finished.pop(next(iter(self._finished)))
+                    self._finished[prompt_id] = result
+                elif not future.done():
+                    if result is None:
+                        future.set_result(None)
+                    else:
+                        future.set_exception(result)
+        finally:
+            # Conexao caiu: quem estava esperando cai no polling
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("WebSocket do ComfyUI fechado"))
 
     async def is_available(self) -> bool:
-        """Verifica se ComfyUI esta rodando"""
+        """Verifica se ComfyUI esta rodando (cache curto para geracoes em sequencia)"""
+        now = time.monotonic()
+        if self._avail_cache and now - self._avail_cache[0] < self.AVAILABLE_CACHE_TTL:
+            return self._avail_cache[1]
+
         try:
-            async with httpx.AsyncClient(timeout=5.0) as client:
-                response = await client.get(f"{self.base_url}/system_stats")
-                return response.status_code == 200
+            response = await self._get_http().get("/system_stats", timeout=5.0)
+            ok = response.status_code == 200
         except:
-            return False
+            ok = False
+        self._avail_cache = (now, ok)
+        return ok
 
     async def queue_prompt(self, workflow: Dict[str, Any]) -> str:
         """Envia workflow para fila de execucao"""
@@ -35,19 +129,26 @@ class ComfyUIClient:
             "client_id": self.client_id
         }
 
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(
-                f"{self.base_url}/prompt",
-                json=payload
+        try:
+            # Corpo ja serializado - evita o encoder json padrao do httpx
+            response = await self._get_http().post(
+                "/prompt", content=json_dumpb(payload), headers=JSON_HEADERS
             )
-            result = response.json()
-            return result.get("prompt_id")
+            result = json_loads(response.content)
+        except Exception:
+            # Servidor pode ter caido: proxima verificacao consulta de novo
+            self._avail_cache = None
+            raise
+
+        prompt_id = result.get("prompt_id")
+        if not prompt_id:
+            self._avail_cache = None
+        return prompt_id
 
     async def get_history(self, prompt_id: str) -> Dict[str, Any]:
         """Busca historico de um prompt"""
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(f"{self.base_url}/history/{prompt_id}")
-            return response.json()
+        response = await self._get_http().get(f"/history/{prompt_id}")
+        return json_loads(response.content)
 
     async def get_image(self, filename: str, subfolder: str = "", folder_type: str = "output") -> bytes:
         """Baixa imagem gerada"""
@@ -57,55 +158,89 @@ class ComfyUIClient:
             "type": folder_type
         }
 
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            response = await client.get(f"{self.base_url}/view", params=params)
-            return response.content
+        response = await self._get_http().get("/view", params=params, timeout=60.0)
+        return response.content
+
+    async def get_image_to_file(
+        self,
+        filepath: Path,
+        filename: str,
+        subfolder: str = "",
+        folder_type: str = "output",
+        on_chunk: Optional[Callable[[bytes], None]] = None
+    ):
+        """Baixa imagem gerada direto para o disco, em blocos"""
+        params = {
+            "filename": filename,
+            "subfolder": subfolder,
+            "type": folder_type
+        }
+
+        async with self._get_http().stream("GET", "/view", params=params, timeout=60.0) as response:
+            response.raise_for_status()
+            with open(filepath, "wb") as f:
+                async for chunk in response.aiter_bytes(IMAGE_CHUNK_SIZE):
+                    f.write(chunk)
+                    if on_chunk:
+                        on_chunk(chunk)
 
     async def generate_and_wait(self, workflow: Dict[str, Any], timeout: int = 300) -> Optional[bytes]:
         """Gera imagem e aguarda resultado"""
-        prompt_id = await self.queue_prompt(workflow)
-
-        if not prompt_id:
+        image = await self.wait_for_image(workflow, timeout)
+        if image is None:
             return None
+        return await self.get_image(image["filename"], image.get("subfolder", ""))
 
-        # Conecta via WebSocket para receber atualizacoes
+    async def wait_for_image(
+        self,
+        workflow: Dict[str, Any],
+        timeout: int = 300
+    ) -> Optional[Dict[str, Any]]:
+        """Gera imagem e retorna os dados do arquivo gerado (filename, subfolder)"""
+        # Conecta antes de enfileirar para nao perder as mensagens do prompt
         try:
-            async with websockets.connect(f"{self.ws_url}?clientId={self.client_id}") as ws:
-                start_time = asyncio.get_event_loop().time()
-
-                while True:
-                    # Timeout check
-                    if asyncio.get_event_loop().time() - start_time > timeout:
-                        raise TimeoutError("Timeout gerando imagem")
+            await self._ensure_ws()
+            ws_error = None
+        except Exception as e:
+            ws_error = e
 
-                    try:
-                        message = await asyncio.wait_for(ws.recv(), timeout=1.0)
-                        data = json.loads(message)
+        prompt_id = await self.queue_prompt(workflow)
 
-                        if data.get("type") == "executing":
-                            exec_data = data.get("data", {})
-                            if exec_data.get("prompt_id") == prompt_id:
-                                if exec_data.get("node") is None:
-                                    # Execucao completa
-                                    break
+        if not prompt_id:
+            return None
 
-                        elif data.get("type") == "execution_error":
-                            error_data = data.get("data", {})
-                            raise Exception(f"Erro ComfyUI: {error_data}")
+        history = None
 
-                    except asyncio.TimeoutError:
-                        continue
+        if ws_error is not None:
+            # Sem WebSocket (inclusive timeout ao conectar): polling do historico
+            logger.warning("WebSocket do ComfyUI indisponivel (%r), usando polling", ws_error)
+            history = await self._poll_history(prompt_id, timeout)
+        else:
+            # Recebe atualizacoes pelo WebSocket compartilhado
+            try:
+                if prompt_id in self._finished:
+                    error = self._finished.pop(prompt_id)
+                    if error:
+                        raise error
+                else:
+                    future = asyncio.get_running_loop().create_future()
+                    self._pending[prompt_id] = future
+                    try:
+                        # Timeout unico para toda a espera, sem wait_for por mensagem
+                        await asyncio.wait_for(future, timeout=timeout)
+                    finally:
+                        self._pending.pop(prompt_id, None)
 
-        except Exception as e:
-            # Fallback: polling do historico
-            for _ in range(timeout):
-                await asyncio.sleep(1)
-                history = await self.get_history(prompt_id)
-                if prompt_id in history:
-                    break
+            except asyncio.TimeoutError:
+                raise TimeoutError("Timeout gerando imagem")
+            except (OSError, websockets.exceptions.WebSocketException) as e:
+                # Fallback so se o WebSocket caiu durante a espera
+                logger.warning("WebSocket do ComfyUI falhou (%r), usando polling", e)
+                history = await self._poll_history(prompt_id, timeout)
 
         # Busca resultado no historico
-        history = await self.get_history(prompt_id)
+        if history is None:
+            history = await self.get_history(prompt_id)
 
         if prompt_id not in history:
             return None
@@ -116,10 +251,29 @@ class ComfyUIClient:
         for node_id, output in outputs.items():
             if "images" in output:
                 for img in output["images"]:
-                    filename = img.get("filename")
-                    subfolder = img.get("subfolder", "")
-                    if filename:
-                        return await self.get_image(filename, subfolder)
+                    if img.get("filename"):
+                        return img
+
+        return None
+
+    async def _poll_history(self, prompt_id: str, timeout: float) -> Optional[Dict[str, Any]]:
+        """Consulta o historico com backoff exponencial ate o prompt terminar"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        delay = 0.2
+
+        while loop.time() < deadline:
+            await asyncio.sleep(delay)
+            history = await self.get_history(prompt_id)
+            entry = history.get(prompt_id)
+            if entry:
+                status = entry.get("status", {})
+                if (
+                    status.get("completed", True)
+                    or status.get("status_str") in ("success", "error")
+                ):
+                    return history
+            delay = min(delay * 1.5, 2.0)
 
         return None
 
@@ -137,8 +291,7 @@ class ComfyUIClient:
         """Cria workflow para FLUX.1"""
 
         if seed == -1:
-            import random
-            seed = random.randint(0, 2**32 - 1)
+            seed = random.getrandbits(32)
 
         workflow = {
             "6": {
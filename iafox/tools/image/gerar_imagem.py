@@ -1,12 +1,32 @@
 """Tool para gerar imagens com FLUX.1 via ComfyUI"""
 import asyncio
 import base64
+import mmap
+import os
 from pathlib import Path
 from datetime import datetime
 from typing import Optional
 from .comfyui_client import ComfyUIClient
 
 
+class _Base64Stream:
+    """Codifica base64 de forma incremental (blocos alinhados em 3 bytes)"""
+
+    def __init__(self):
+        self._parts: list[bytes] = []
+        self._rest = b""
+
+    def update(self, chunk: bytes):
+        data = self._rest + chunk
+        cut = len(data) - len(data) % 3
+        self._parts.append(base64.b64encode(data[:cut]))
+        self._rest = data[cut:]
+
+    def finish(self) -> str:
+        self._parts.append(base64.b64encode(self._rest))
+        return b"".join(self._parts).decode("ascii")
+
+
 class GeradorImagem:
     """Gera imagens usando FLUX.1 via ComfyUI"""
 
@@ -20,6 +40,12 @@ class GeradorImagem:
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(parents=True, exist_ok=True)
 
+    async def __aenter__(self) -> "GeradorImagem":
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.client.aclose()
+
     async def verificar_comfyui(self) -> bool:
         """Verifica se ComfyUI esta disponivel"""
         return await self.client.is_available()
@@ -34,7 +60,8 @@ class GeradorImagem:
         cfg: float = 3.5,
         seed: int = -1,
         modelo: str = "flux1-dev.safetensors",
-        salvar: bool = True
+        salvar: bool = True,
+        incluir_base64: bool = False
     ) -> dict:
         """
         Gera uma imagem usando FLUX.1
@@ -49,9 +76,10 @@ class GeradorImagem:
             seed: Seed para reproducibilidade (-1 = aleatorio)
             modelo: Nome do modelo FLUX
             salvar: Se deve salvar a imagem em disco
+            incluir_base64: Se deve retornar a imagem em base64 (sempre quando salvar=False)
 
         Returns:
-            dict com status, caminho do arquivo e base64 da imagem
+            dict com status, caminho do arquivo e (opcional) base64 da imagem
         """
 
         # Verifica se ComfyUI esta rodando
@@ -80,9 +108,9 @@ class GeradorImagem:
             )
 
             # Gera a imagem
-            image_bytes = await self.client.generate_and_wait(workflow, timeout=300)
+            image = await self.client.wait_for_image(workflow, timeout=300)
 
-            if not image_bytes:
+            if not image:
                 return {
                     "sucesso": False,
                     "erro": "Falha ao gerar imagem - nenhum resultado retornado"
@@ -97,19 +125,30 @@ class GeradorImagem:
                 "modelo": modelo
             }
 
-            # Salva em disco se solicitado
+            # Salva em disco se solicitado: download vai direto para o arquivo
             if salvar:
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                filename = f"flux_{timestamp}.png"
-                filepath = self.output_dir / filename
-
-                with open(filepath, "wb") as f:
-                    f.write(image_bytes)
+                filepath = self._novo_arquivo()
+                encoder = _Base64Stream() if incluir_base64 else None
+                try:
+                    await self.client.get_image_to_file(
+                        filepath,
+                        image["filename"],
+                        image.get("subfolder", ""),
+                        on_chunk=encoder.update if encoder else None
+                    )
+                except BaseException:
+                    filepath.unlink(missing_ok=True)
+                    raise
 
                 result["arquivo"] = str(filepath.absolute())
-
-            # Retorna base64 para exibicao
-            result["imagem_base64"] = base64.b64encode(image_bytes).decode("utf-8")
+                # Retorna base64 para exibicao
+                if encoder:
+                    result["imagem_base64"] = encoder.finish()
+            else:
+                image_bytes = await self.client.get_image(
+                    image["filename"], image.get("subfolder", "")
+                )
+                result["imagem_base64"] = base64.b64encode(image_bytes).decode("utf-8")
 
             return result
 
@@ -124,6 +163,69 @@ class GeradorImagem:
                 "erro": f"Erro ao gerar imagem: {str(e)}"
             }
 
+    def _novo_arquivo(self) -> Path:
+        """Reserva um nome de arquivo unico (geracoes em lote terminam no mesmo segundo)"""
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        filepath = self.output_dir / f"flux_{timestamp}.png"
+        n = 1
+        while True:
+            try:
+                # Cria o arquivo ja na reserva: outra geracao nao pega o mesmo nome
+                open(filepath, "xb").close()
+                return filepath
+            except FileExistsError:
+                filepath = self.output_dir / f"flux_{timestamp}_{n}.png"
+                n += 1
+
+    async def gerar_batch(self, prompts: list[dict], max_concurrency: int = 4) -> list[dict]:
+        """
+        Gera varias imagens, enfileirando no ComfyUI em paralelo
+
+        Args:
+            prompts: Lista de kwargs para gerar()
+            max_concurrency: Maximo de geracoes simultaneas
+
+        Returns:
+            Lista de resultados, na mesma ordem dos prompts
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def one(kwargs: dict) -> dict:
+            async with semaphore:
+                return await self.gerar(**kwargs)
+
+        return await asyncio.gather(*(one(p) for p in prompts))
+
+
+def obter_base64(arquivo: str) -> str:
+    """Codifica em base64 uma imagem ja salva (sob demanda, via mmap)"""
+    with open(arquivo, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return ""
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return base64.b64encode(mm).decode("ascii")
+
+
+# Gerador compartilhado pelas tools (reaproveita cliente HTTP, WebSocket e
+# cache de disponibilidade do ComfyUI entre chamadas)
+_gerador: Optional[GeradorImagem] = None
+
+
+def get_gerador() -> GeradorImagem:
+    """Obtem o gerador compartilhado (criado no primeiro uso)"""
+    global _gerador
+    if _gerador is None:
+        _gerador = GeradorImagem()
+    return _gerador
+
+
+async def fechar_gerador():
+    """Fecha o gerador compartilhado (ao encerrar a aplicacao/event loop)"""
+    global _gerador
+    if _gerador is not None:
+        await _gerador.client.aclose()
+        _gerador = None
+
 
 # Funcao de conveniencia para uso como tool
 async def gerar_imagem(
@@ -131,7 +233,8 @@ async def gerar_imagem(
     largura: int = 1024,
     altura: int = 1024,
     passos: int = 20,
-    seed: int = -1
+    seed: int = -1,
+    incluir_base64: bool = False
 ) -> dict:
     """
     Tool para gerar imagens com FLUX.1
@@ -142,15 +245,40 @@ async def gerar_imagem(
         altura: Altura em pixels (padrao 1024, max 2048)
         passos: Qualidade/tempo (10=rapido, 20=normal, 30=alta qualidade)
         seed: Numero para reproduzir mesma imagem (-1=aleatorio)
+        incluir_base64: Se deve retornar preview em base64
 
     Retorna:
-        Caminho da imagem salva e preview em base64
+        Caminho da imagem salva e (opcional) preview em base64
     """
-    gerador = GeradorImagem()
-    return await gerador.gerar(
+    return await get_gerador().gerar(
         prompt=prompt,
         largura=min(largura, 2048),
         altura=min(altura, 2048),
         passos=min(passos, 50),
-        seed=seed
+        seed=seed,
+        incluir_base64=incluir_base64
     )
+
+
+async def gerar_imagens(prompts: list[dict], max_concurrency: int = 4) -> list[dict]:
+    """
+    Tool para gerar varias imagens com FLUX.1 de uma vez
+
+    Parametros:
+        prompts: Lista de dicts com os mesmos parametros de gerar_imagem
+        max_concurrency: Maximo de geracoes simultaneas
+
+    Retorna:
+        Lista de resultados, na mesma ordem dos prompts
+    """
+    limited = [
+        {
+            **p,
+            "largura": min(p.get("largura", 1024), 2048),
+            "altura": min(p.get("altura", 1024), 2048),
+            "passos": min(p.get("passos", 20), 50),
+        }
+        for p in prompts
+    ]
+    # Gerador compartilhado: mesmo client_id e pool de conexoes para todo o lote
+    return await get_gerador().gerar_batch(limited, max_concurrency)
@@ -11,6 +11,16 @@ from typing import List, Dict, Optional
 BASE_DIR = Path(__file__).parent.parent.parent.parent
 INDEX_DIR = BASE_DIR / "conhecimento" / "index"
 
+# Coleção aberta reaproveitada entre buscas: (mtime do índice, coleção)
+_COLLECTION_CACHE: Optional[tuple] = None
+
+# Cache de buscas repetidas: (query, materia, max_results) -> (mtime do índice, resultado)
+_QUERY_CACHE: Dict[tuple, tuple] = {}
+QUERY_CACHE_SIZE = 256
+
+# Matérias distintas do índice: (mtime do índice, matérias)
+_MATERIAS_CACHE: Optional[tuple] = None
+
 
 def verificar_index_existe() -> bool:
     """Verifica se o índice existe."""
@@ -18,6 +28,33 @@ def verificar_index_existe() -> bool:
     return INDEX_DIR.exists() and any(INDEX_DIR.iterdir())
 
 
+def _index_mtime() -> int:
+    """mtime do banco do índice (muda quando o indexador roda de novo)."""
+    try:
+        return (INDEX_DIR / "chroma.sqlite3").stat().st_mtime_ns
+    except OSError:
+        return 0
+
+
+def _get_collection():
+    """Retorna a coleção do índice, reabrindo só se o índice mudou."""
+    global _COLLECTION_CACHE
+    if _COLLECTION_CACHE and _COLLECTION_CACHE[0] == _index_mtime():
+        return _COLLECTION_CACHE[1]
+
+    import chromadb
+    from chromadb.config import Settings
+
+    client = chromadb.PersistentClient(
+        path=str(INDEX_DIR),
+        settings=Settings(anonymized_telemetry=False)
+    )
+    collection = client.get_collection("conhecimento_iafox")
+    # mtime lido depois de abrir: a abertura pode tocar o arquivo
+    _COLLECTION_CACHE = (_index_mtime(), collection)
+    return collection
+
+
 def buscar_nos_livros(query: str, materia: Optional[str] = None, max_results: int = 5) -> str:
     """
     Busca informações nos livros indexados.
@@ -39,19 +76,30 @@ Para usar a busca nos livros, você precisa:
 
 Ainda não há livros indexados no sistema."""
 
-    try:
-        import chromadb
-        from chromadb.config import Settings
+    # Mesma busca no mesmo índice: evita embedding + consulta ao ChromaDB
+    key = (query, materia, max_results)
+    mtime = _index_mtime()
+    cached = _QUERY_CACHE.pop(key, None)
+    if cached and cached[0] == mtime:
+        _QUERY_CACHE[key] = cached
+        return cached[1]
+
+    output = _buscar(query, materia, max_results)
+    if not output.startswith("❌"):
+        if len(_QUERY_CACHE) >= QUERY_CACHE_SIZE:
+            _QUERY_CACHE.pop(next(iter(_QUERY_CACHE), None), None)
+        _QUERY_CACHE[key] = (mtime, output)
+    return output
 
-        # Conectar ao índice
-        client = chromadb.PersistentClient(
-            path=str(INDEX_DIR),
-            settings=Settings(anonymized_telemetry=False)
-        )
 
-        # Obter coleção
+def _buscar(query: str, materia: Optional[str], max_results: int) -> str:
+    """Executa a busca no ChromaDB e formata os resultados."""
+    try:
+        # Obter coleção (conexão reaproveitada)
         try:
-            collection = client.get_collection("conhecimento_iafox")
+            collection = _get_collection()
+        except ImportError:
+            raise
         except:
             return "❌ Coleção não encontrada. Rode o indexador primeiro: python -m iafox.tools.rag.indexar"
 
@@ -105,24 +153,18 @@ def listar_materias_disponiveis() -> str:
     if not verificar_index_existe():
         return "Índice não encontrado."
 
+    global _MATERIAS_CACHE
     try:
-        import chromadb
-        from chromadb.config import Settings
-
-        client = chromadb.PersistentClient(
-            path=str(INDEX_DIR),
-            settings=Settings(anonymized_telemetry=False)
-        )
-
-        collection = client.get_collection("conhecimento_iafox")
-
-        # Buscar todas as matérias únicas
-        all_data = collection.get()
-        materias = set()
-
-        for metadata in all_data["metadatas"]:
-            if metadata.get("materia"):
-                materias.add(metadata["materia"])
+        mtime = _index_mtime()
+        if _MATERIAS_CACHE and _MATERIAS_CACHE[0] == mtime:
+            materias = _MATERIAS_CACHE[1]
+        else:
+            collection = _get_collection()
+
+            # Buscar todas as matérias únicas (só metadados, sem textos nem embeddings)
+            all_data = collection.get(include=["metadatas"])
+            materias = {m["materia"] for m in all_data["metadatas"] if m and m.get("materia")}
+            _MATERIAS_CACHE = (mtime, materias)
 
         if not materias:
             return "Nenhuma matéria encontrada no índice."
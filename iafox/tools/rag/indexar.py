@@ -3,10 +3,22 @@ Indexador de documentos para o sistema RAG do IAFOX.
 Lê PDFs e arquivos Markdown da pasta conhecimento e cria um índice pesquisável.
 """
 
+import hashlib
+import json
 import os
+import re
 import sys
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Dict
+from typing import List, Dict, Optional
+
+# Import opcional - pypdfium2 (PDFium em C) extrai texto bem mais rápido que PyPDF2
+try:
+    import pypdfium2 as pdfium
+    PDFIUM_AVAILABLE = True
+except ImportError:
+    PDFIUM_AVAILABLE = False
 
 # Diretórios
 BASE_DIR = Path(__file__).parent.parent.parent.parent
@@ -14,47 +26,115 @@ CONHECIMENTO_DIR = BASE_DIR / "conhecimento"
 LIVROS_DIR = CONHECIMENTO_DIR / "livros_8ano"
 PROGRAMACAO_DIR = CONHECIMENTO_DIR / "programacao"
 INDEX_DIR = CONHECIMENTO_DIR / "index"
+MANIFEST_PATH = INDEX_DIR / "manifest.json"
+
+# Chunks de PDF: janela de 1000 caracteres com 200 de sobreposição
+PDF_CHUNK_SIZE = 1000
+PDF_CHUNK_STRIDE = 800
+
+# Chunks por chamada a collection.add
+INDEX_BATCH_SIZE = 1024
+
+# Mesmo modelo do embedding padrão do ChromaDB (usado nas buscas por query_texts)
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+
+# Palavras-chave por matéria/categoria (a primeira que casar, na ordem, vence)
+MATERIAS = {
+    "matematica": ["matematica", "math", "mat"],
+    "portugues": ["portugues", "portugus", "lingua", "redacao"],
+    "ciencias": ["ciencias", "ciencia", "biologia", "fisica", "quimica"],
+    "historia": ["historia", "hist"],
+    "geografia": ["geografia", "geo"],
+    "ingles": ["ingles", "english", "ing"],
+    "arte": ["arte", "artes"],
+    "educacao_fisica": ["educacao_fisica", "ed_fisica", "edfisica"],
+}
+
+CATEGORIAS = {
+    "csharp": ["csharp", "c#", "dotnet", ".net"],
+    "python": ["python", "py"],
+    "javascript": ["javascript", "js", "node", "typescript", "ts"],
+    "java": ["java"],
+    "remote_desktop": ["remote", "desktop", "rdp", "vnc"],
+    "networking": ["network", "socket", "tcp", "udp", "http"],
+    "matematica": ["matematica", "math", "mat"],
+    "portugues": ["portugues", "portugus", "lingua", "redacao"],
+    "ciencias": ["ciencias", "ciencia", "biologia", "fisica", "quimica"],
+    "historia": ["historia", "hist"],
+    "geografia": ["geografia", "geo"],
+    "ingles": ["ingles", "english", "ing"],
+}
+
+
+def _compilar_palavras(grupos: Dict[str, List[str]]):
+    """Compila as palavras-chave em uma regex só, um grupo nomeado por chave."""
+    alternativas = "|".join(
+        f"(?P<{nome}>{'|'.join(re.escape(p) for p in palavras)})"
+        for nome, palavras in grupos.items()
+    )
+    # Lookahead: testa todas as posições, inclusive casamentos sobrepostos
+    return re.compile(f"(?=(?:{alternativas}))"), {nome: i for i, nome in enumerate(grupos)}
+
+
+def _detectar(regex: re.Pattern, ordem: Dict[str, int], caminho: str) -> str:
+    """Retorna a chave de maior prioridade com alguma palavra no caminho."""
+    achados = {m.lastgroup for m in regex.finditer(caminho.lower())}
+    return min(achados, key=ordem.__getitem__) if achados else "geral"
 
 
-def extrair_texto_pdf(pdf_path: str) -> List[Dict]:
-    """Extrai texto de um PDF, retornando lista de chunks com metadados."""
+_MATERIAS_RE, _MATERIAS_ORDEM = _compilar_palavras(MATERIAS)
+_CATEGORIAS_RE, _CATEGORIAS_ORDEM = _compilar_palavras(CATEGORIAS)
+
+
+def ler_paginas_pdf(pdf_path: str) -> List[str]:
+    """Retorna o texto de cada página do PDF (pypdfium2 se instalado, senão PyPDF2)."""
+    if PDFIUM_AVAILABLE:
+        pdf = pdfium.PdfDocument(pdf_path)
+        try:
+            paginas = []
+            for page in pdf:
+                textpage = page.get_textpage()
+                paginas.append(textpage.get_text_range())
+                textpage.close()
+                page.close()
+            return paginas
+        finally:
+            pdf.close()
+
     from PyPDF2 import PdfReader
+    return [page.extract_text() or "" for page in PdfReader(pdf_path).pages]
+
 
+def extrair_texto_pdf(pdf_path: str) -> Optional[List[Dict]]:
+    """Extrai texto de um PDF em chunks com metadados (None se a leitura falhar)."""
     chunks = []
     try:
-        reader = PdfReader(pdf_path)
+        paginas = ler_paginas_pdf(pdf_path)
         nome_arquivo = Path(pdf_path).stem
 
         # Detectar matéria pelo nome do arquivo ou pasta
         materia = detectar_materia(pdf_path)
 
-        texto_acumulado = ""
-        pagina_inicio = 1
-
-        for i, page in enumerate(reader.pages):
-            texto = page.extract_text() or ""
-            texto_acumulado += texto + "\n"
-
-            # Criar chunk a cada ~1000 caracteres ou a cada 3 páginas
-            if len(texto_acumulado) >= 1000 or (i + 1) % 3 == 0:
-                if texto_acumulado.strip():
-                    chunks.append({
-                        "texto": texto_acumulado.strip(),
-                        "arquivo": nome_arquivo,
-                        "materia": materia,
-                        "paginas": f"{pagina_inicio}-{i+1}",
-                        "fonte": pdf_path
-                    })
-                texto_acumulado = ""
-                pagina_inicio = i + 2
-
-        # Último chunk
-        if texto_acumulado.strip():
+        # Janela deslizante sobre o texto completo; offsets mapeiam posição -> página
+        offsets = []
+        pos = 0
+        for texto in paginas:
+            offsets.append(pos)
+            pos += len(texto) + 1
+        completo = "\n".join(paginas)
+
+        fim_inicios = max(len(completo) - PDF_CHUNK_SIZE, 0) + PDF_CHUNK_STRIDE
+        for inicio in range(0, fim_inicios, PDF_CHUNK_STRIDE):
+            fim = min(inicio + PDF_CHUNK_SIZE, len(completo))
+            texto = completo[inicio:fim].strip()
+            if not texto:
+                continue
             chunks.append({
-                "texto": texto_acumulado.strip(),
+                "texto": texto,
                 "arquivo": nome_arquivo,
                 "materia": materia,
-                "paginas": f"{pagina_inicio}-{len(reader.pages)}",
+                "paginas": f"{bisect_right(offsets, inicio)}-{bisect_right(offsets, fim - 1)}",
                 "fonte": pdf_path
             })
 
@@ -62,45 +142,31 @@ def extrair_texto_pdf(pdf_path: str) -> List[Dict]:
 
     except Exception as e:
         print(f"  ✗ Erro ao ler {pdf_path}: {e}")
+        return None
 
     return chunks
 
 
 def detectar_materia(caminho: str) -> str:
     """Detecta a matéria baseado no caminho ou nome do arquivo."""
-    caminho_lower = caminho.lower()
-
-    materias = {
-        "matematica": ["matematica", "math", "mat"],
-        "portugues": ["portugues", "portugus", "lingua", "redacao"],
-        "ciencias": ["ciencias", "ciencia", "biologia", "fisica", "quimica"],
-        "historia": ["historia", "hist"],
-        "geografia": ["geografia", "geo"],
-        "ingles": ["ingles", "english", "ing"],
-        "arte": ["arte", "artes"],
-        "educacao_fisica": ["educacao_fisica", "ed_fisica", "edfisica"],
-    }
+    return _detectar(_MATERIAS_RE, _MATERIAS_ORDEM, caminho)
 
-    for materia, keywords in materias.items():
-        for keyword in keywords:
-            if keyword in caminho_lower:
-                return materia
 
-    return "geral"
+def encontrar_arquivos(diretorio: Path, extensao: str) -> List[str]:
+    """Encontra todos os arquivos com a extensão (ex: '.pdf') em um diretório e subdiretórios."""
+    return [
+        str(p) for p in diretorio.rglob("*")
+        if p.suffix.lower() == extensao and p.is_file()
+    ]
 
 
 def encontrar_pdfs(diretorio: Path) -> List[str]:
     """Encontra todos os PDFs em um diretório e subdiretórios."""
-    pdfs = []
-    for root, dirs, files in os.walk(diretorio):
-        for file in files:
-            if file.lower().endswith('.pdf'):
-                pdfs.append(os.path.join(root, file))
-    return pdfs
+    return encontrar_arquivos(diretorio, ".pdf")
 
 
-def extrair_texto_markdown(md_path: str) -> List[Dict]:
-    """Extrai texto de um arquivo Markdown, retornando lista de chunks com metadados."""
+def extrair_texto_markdown(md_path: str) -> Optional[List[Dict]]:
+    """Extrai texto de um Markdown em chunks com metadados (None se a leitura falhar)."""
     chunks = []
     try:
         with open(md_path, 'r', encoding='utf-8') as f:
@@ -152,54 +218,67 @@ def extrair_texto_markdown(md_path: str) -> List[Dict]:
 
     except Exception as e:
         print(f"  ✗ Erro ao ler {md_path}: {e}")
+        return None
 
     return chunks
 
 
 def encontrar_markdowns(diretorio: Path) -> List[str]:
     """Encontra todos os arquivos Markdown em um diretório e subdiretórios."""
-    mds = []
-    for root, dirs, files in os.walk(diretorio):
-        for file in files:
-            if file.lower().endswith('.md'):
-                mds.append(os.path.join(root, file))
-    return mds
+    return encontrar_arquivos(diretorio, ".md")
 
 
 def detectar_categoria(caminho: str) -> str:
     """Detecta a categoria baseado no caminho."""
-    caminho_lower = caminho.lower()
-
-    categorias = {
-        "csharp": ["csharp", "c#", "dotnet", ".net"],
-        "python": ["python", "py"],
-        "javascript": ["javascript", "js", "node", "typescript", "ts"],
-        "java": ["java"],
-        "remote_desktop": ["remote", "desktop", "rdp", "vnc"],
-        "networking": ["network", "socket", "tcp", "udp", "http"],
-        "matematica": ["matematica", "math", "mat"],
-        "portugues": ["portugues", "portugus", "lingua", "redacao"],
-        "ciencias": ["ciencias", "ciencia", "biologia", "fisica", "quimica"],
-        "historia": ["historia", "hist"],
-        "geografia": ["geografia", "geo"],
-        "ingles": ["ingles", "english", "ing"],
-    }
+    return _detectar(_CATEGORIAS_RE, _CATEGORIAS_ORDEM, caminho)
 
-    for categoria, keywords in categorias.items():
-        for keyword in keywords:
-            if keyword in caminho_lower:
-                return categoria
 
-    return "geral"
+def calcular_embeddings(textos: List[str]):
+    """Calcula embeddings em lote com sentence-transformers (GPU se disponível)."""
+    try:
+        from sentence_transformers import SentenceTransformer
+    except ImportError:
+        # Sem sentence-transformers o ChromaDB calcula os embeddings no add
+        return None
+
+    print(f"  → Calculando embeddings ({EMBEDDING_MODEL})...")
+    model = SentenceTransformer(EMBEDDING_MODEL)
+    return model.encode(
+        textos,
+        batch_size=64,
+        show_progress_bar=True,
+        normalize_embeddings=True,
+        convert_to_numpy=True
+    )
+
+
+def hash_arquivo(caminho: str) -> str:
+    """SHA-256 do conteúdo do arquivo (lido em blocos)."""
+    h = hashlib.sha256()
+    with open(caminho, "rb") as f:
+        for bloco in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(bloco)
+    return h.hexdigest()
+
+
+def carregar_manifesto() -> Dict[str, Dict]:
+    """Carrega o manifesto do índice: caminho -> {mtime, sha256, chunk_ids}."""
+    try:
+        return json.loads(MANIFEST_PATH.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
 
+def salvar_manifesto(manifesto: Dict[str, Dict]):
+    """Salva o manifesto do índice."""
+    MANIFEST_PATH.write_text(json.dumps(manifesto, ensure_ascii=False), encoding="utf-8")
 
-def criar_index(chunks: List[Dict]):
-    """Cria o índice vetorial usando ChromaDB."""
+
+def abrir_colecao(recriar: bool = False):
+    """Abre (ou cria) a coleção do índice; com recriar, apaga a anterior."""
     import chromadb
     from chromadb.config import Settings
 
-    print("\n📊 Criando índice vetorial...")
-
     # Criar cliente ChromaDB persistente
     client = chromadb.PersistentClient(
         path=str(INDEX_DIR),
@@ -207,50 +286,97 @@ def criar_index(chunks: List[Dict]):
     )
 
     # Deletar coleção existente se houver
-    try:
-        client.delete_collection("conhecimento_iafox")
-        print("  → Índice anterior removido")
-    except:
-        pass
-
-    # Criar nova coleção
-    collection = client.create_collection(
+    if recriar:
+        try:
+            client.delete_collection("conhecimento_iafox")
+            print("  → Índice anterior removido")
+        except:
+            pass
+
+    return client.get_or_create_collection(
         name="conhecimento_iafox",
         metadata={"description": "Base de conhecimento IAFOX"}
     )
 
+
+def _metadados(chunk: Dict) -> Dict:
+    """Metadados de um chunk no índice."""
+    return {
+        "arquivo": chunk["arquivo"],
+        "materia": chunk["materia"],
+        "paginas": chunk["paginas"],
+        "fonte": chunk["fonte"]
+    }
+
+
+def criar_index(chunks: List[Dict], collection) -> Dict[str, List[str]]:
+    """Adiciona os chunks ao índice vetorial; retorna os ids de cada arquivo fonte."""
+    print("\n📊 Atualizando índice vetorial...")
+
+    # Ids pelo conteúdo: texto repetido (entre arquivos ou execuções) vira um chunk só
+    ids_por_fonte: Dict[str, List[str]] = {}
+    vistos = set()
+    novos = []
+    ids_todos = []
+    for c in chunks:
+        chunk_id = hashlib.blake2b(c["texto"].encode("utf-8"), digest_size=16).hexdigest()
+        ids_por_fonte.setdefault(c["fonte"], []).append(chunk_id)
+        if chunk_id not in vistos:
+            vistos.add(chunk_id)
+            novos.append(c)
+            ids_todos.append(chunk_id)
+
+    # Chunks que já estão no índice não são recalculados
+    existentes = set()
+    for i in range(0, len(ids_todos), INDEX_BATCH_SIZE):
+        existentes.update(collection.get(ids=ids_todos[i:i+INDEX_BATCH_SIZE], include=[])["ids"])
+    if existentes:
+        # Mas os metadados são atualizados: arquivo movido, páginas após edição etc.
+        repetidos = [(chunk_id, c) for c, chunk_id in zip(novos, ids_todos)
+                     if chunk_id in existentes]
+        for i in range(0, len(repetidos), INDEX_BATCH_SIZE):
+            lote = repetidos[i:i+INDEX_BATCH_SIZE]
+            collection.update(
+                ids=[chunk_id for chunk_id, _ in lote],
+                metadatas=[_metadados(c) for _, c in lote]
+            )
+        novos = [c for c, chunk_id in zip(novos, ids_todos) if chunk_id not in existentes]
+        ids_todos = [chunk_id for chunk_id in ids_todos if chunk_id not in existentes]
+    chunks = novos
+
     # Adicionar chunks ao índice
-    print(f"  → Indexando {len(chunks)} chunks...")
+    print(f"  → Indexando {len(chunks)} chunks ({len(vistos) - len(chunks)} já no índice)...")
+
+    embeddings = calcular_embeddings([c["texto"] for c in chunks]) if chunks else None
 
-    # Processar em lotes de 100
-    batch_size = 100
+    # Processar em lotes grandes: menos commits no SQLite
+    batch_size = INDEX_BATCH_SIZE
     for i in range(0, len(chunks), batch_size):
         batch = chunks[i:i+batch_size]
 
-        ids = [f"chunk_{i+j}" for j in range(len(batch))]
+        ids = ids_todos[i:i+batch_size]
         documents = [c["texto"] for c in batch]
-        metadatas = [{
-            "arquivo": c["arquivo"],
-            "materia": c["materia"],
-            "paginas": c["paginas"],
-            "fonte": c["fonte"]
-        } for c in batch]
-
-        collection.add(
+        metadatas = [_metadados(c) for c in batch]
+
+        collection.upsert(
             ids=ids,
             documents=documents,
-            metadatas=metadatas
+            metadatas=metadatas,
+            embeddings=embeddings[i:i+batch_size].tolist() if embeddings is not None else None
         )
 
         print(f"  → Lote {i//batch_size + 1}/{(len(chunks)-1)//batch_size + 1} indexado")
 
-    print(f"\n✅ Índice criado com sucesso!")
-    print(f"   Total de chunks: {len(chunks)}")
+    print(f"\n✅ Índice atualizado com sucesso!")
+    print(f"   Chunks novos: {len(chunks)}")
+    print(f"   Total no índice: {collection.count()}")
     print(f"   Local: {INDEX_DIR}")
 
+    return ids_por_fonte
+
 
-def main():
-    """Função principal do indexador."""
+def main(recriar: bool = False):
+    """Função principal do indexador (incremental; recriar=True reindexa tudo)."""
     print("=" * 50)
     print("🦊 IAFOX - Indexador de Conhecimento RAG")
     print("=" * 50)
@@ -260,43 +386,114 @@ def main():
     PROGRAMACAO_DIR.mkdir(parents=True, exist_ok=True)
     INDEX_DIR.mkdir(parents=True, exist_ok=True)
 
+    pdfs = encontrar_pdfs(LIVROS_DIR)
+    mds = encontrar_markdowns(CONHECIMENTO_DIR)
+
+    if not pdfs and not mds:
+        print("\n❌ Nenhum documento encontrado para indexar.")
+        print("\nAdicione documentos nas pastas:")
+        print("   • conhecimento/livros_8ano/ (PDFs)")
+        print("   • conhecimento/programacao/ (Markdown)")
+        return
+
+    collection = abrir_colecao(recriar)
+    manifesto = {} if recriar else carregar_manifesto()
+    if manifesto and collection.count() == 0:
+        # Coleção apagada por fora: manifesto não vale mais
+        manifesto = {}
+
+    # Só reprocessa arquivos novos ou alterados (mtime, depois hash do conteúdo)
+    alterados: Dict[str, tuple] = {}
+    for caminho in pdfs + mds:
+        mtime = os.stat(caminho).st_mtime_ns
+        entrada = manifesto.get(caminho)
+        if entrada and entrada["mtime"] == mtime:
+            continue
+        sha = hash_arquivo(caminho)
+        if entrada and entrada["sha256"] == sha:
+            entrada["mtime"] = mtime
+            continue
+        alterados[caminho] = (mtime, sha)
+
+    existentes = set(pdfs) | set(mds)
+    removidos = [p for p in manifesto if p not in existentes]
+
+    # Chunks de arquivos apagados ou alterados (removidos depois, se ninguém mais usar)
+    ids_antigos = {
+        chunk_id
+        for p in removidos + [p for p in alterados if p in manifesto]
+        for chunk_id in manifesto[p]["chunk_ids"]
+    }
+    for p in removidos:
+        del manifesto[p]
+
+    pulados = len(pdfs) + len(mds) - len(alterados)
+    if pulados:
+        print(f"\n⏭️  {pulados} arquivos inalterados (pulados)")
+
     todos_chunks = []
+    # Arquivos cuja extração falhou: mantêm entrada e chunks anteriores
+    falhas = set()
 
-    # 1. Buscar PDFs (livros)
-    pdfs = encontrar_pdfs(LIVROS_DIR)
+    def coletar(caminhos, resultados):
+        for caminho, chunks in zip(caminhos, resultados):
+            if chunks is None:
+                falhas.add(caminho)
+            else:
+                todos_chunks.extend(chunks)
+
+    # 1. PDFs (livros)
+    pdfs = [p for p in pdfs if p in alterados]
     if pdfs:
-        print(f"\n📚 Encontrados {len(pdfs)} PDFs:")
+        print(f"\n📚 {len(pdfs)} PDFs para indexar:")
         for pdf in pdfs:
             print(f"   • {Path(pdf).name}")
 
         print("\n📖 Extraindo texto dos PDFs...")
-        for pdf in pdfs:
-            chunks = extrair_texto_pdf(pdf)
-            todos_chunks.extend(chunks)
-
-    # 2. Buscar Markdowns (programação e outros)
-    mds = encontrar_markdowns(CONHECIMENTO_DIR)
+        # Extração é CPU (Python puro): um processo por núcleo contorna o GIL
+        if len(pdfs) > 1:
+            with ProcessPoolExecutor() as ex:
+                coletar(pdfs, ex.map(extrair_texto_pdf, pdfs, chunksize=1))
+        else:
+            coletar(pdfs, map(extrair_texto_pdf, pdfs))
+
+    # 2. Markdowns (programação e outros)
+    mds = [p for p in mds if p in alterados]
     if mds:
-        print(f"\n📄 Encontrados {len(mds)} arquivos Markdown:")
+        print(f"\n📄 {len(mds)} arquivos Markdown para indexar:")
         for md in mds:
             print(f"   • {Path(md).name}")
 
         print("\n📖 Extraindo texto dos Markdowns...")
-        for md in mds:
-            chunks = extrair_texto_markdown(md)
-            todos_chunks.extend(chunks)
-
-    if not todos_chunks:
-        print("\n❌ Nenhum documento encontrado para indexar.")
-        print("\nAdicione documentos nas pastas:")
-        print("   • conhecimento/livros_8ano/ (PDFs)")
-        print("   • conhecimento/programacao/ (Markdown)")
-        return
-
-    print(f"\n📝 Total de chunks extraídos: {len(todos_chunks)}")
-
-    # Criar índice
-    criar_index(todos_chunks)
+        # Markdown é leitura de disco: threads bastam
+        with ThreadPoolExecutor() as ex:
+            coletar(mds, ex.map(extrair_texto_markdown, mds))
+
+    ids_por_fonte = {}
+    if todos_chunks:
+        print(f"\n📝 Total de chunks extraídos: {len(todos_chunks)}")
+
+        # Atualizar índice
+        ids_por_fonte = criar_index(todos_chunks, collection)
+    elif not ids_antigos:
+        print("\n✅ Índice já está atualizado.")
+
+    for caminho, (mtime, sha) in alterados.items():
+        if caminho in falhas:
+            # Não marca como indexado: tenta de novo na próxima execução
+            continue
+        manifesto[caminho] = {
+            "mtime": mtime,
+            "sha256": sha,
+            "chunk_ids": ids_por_fonte.get(caminho, [])
+        }
+
+    # Remove só os chunks que nenhum arquivo usa mais
+    em_uso = {chunk_id for entrada in manifesto.values() for chunk_id in entrada["chunk_ids"]}
+    obsoletos = list(ids_antigos - em_uso)
+    for i in range(0, len(obsoletos), INDEX_BATCH_SIZE):
+        collection.delete(ids=obsoletos[i:i+INDEX_BATCH_SIZE])
+    salvar_manifesto(manifesto)
 
     print("\n🎉 Indexação concluída!")
     print("   A IAFOX agora pode consultar o conhecimento usando:")
@@ -305,4 +502,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    main(recriar="--completo" in sys.argv)
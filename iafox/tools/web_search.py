@@ -2,7 +2,137 @@
 Modulo de busca web usando DuckDuckGo
 """
 
+import asyncio
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
 from duckduckgo_search import DDGS
+from duckduckgo_search.exceptions import RatelimitException
+
+from ..core.config import config
+
+# Um cliente DDGS por thread (reaproveita conexoes entre buscas)
+_local = threading.local()
+
+# Buscas recentes: (tipo, query, max_results) -> (expira_em, resultado)
+_SEARCH_CACHE: dict[tuple[str, str, int], tuple[float, str]] = {}
+_SEARCH_CACHE_LOCK = threading.Lock()
+SEARCH_CACHE_SIZE = 512
+
+# Maximo de requests simultaneos ao DuckDuckGo (limita rate-limit por IP)
+SEARCH_CONCURRENCY = 4
+_SEARCH_SLOTS = threading.BoundedSemaphore(SEARCH_CONCURRENCY)
+
+# Pool proprio das buscas async: threads esperando o DuckDuckGo (ou uma vaga em
+# _SEARCH_SLOTS) nao ocupam o pool padrao usado por leitura de arquivos, RAG etc.
+_SEARCH_EXECUTOR = ThreadPoolExecutor(
+    max_workers=SEARCH_CONCURRENCY, thread_name_prefix="iafox-search"
+)
+
+# Tentativas por busca quando o DuckDuckGo responde com rate limit
+SEARCH_MAX_ATTEMPTS = 3
+
+# Proximo indice em config.search_proxies (rodizio compartilhado entre threads)
+_proxy_index = itertools.count()
+
+# Buscas async em andamento: chamadas iguais aguardam o mesmo future
+_INFLIGHT: dict[tuple[str, str, int], asyncio.Future] = {}
+
+
+def _get_ddgs() -> DDGS:
+    """Obtem o cliente DDGS da thread atual"""
+    ddgs = getattr(_local, "ddgs", None)
+    if ddgs is None:
+        ddgs = _local.ddgs = _new_ddgs()
+    return ddgs
+
+
+def _new_ddgs() -> DDGS:
+    """Cria cliente DDGS usando o proximo proxy de config.search_proxies (se houver)"""
+    proxies = config.search_proxies
+    proxy = proxies[next(_proxy_index) % len(proxies)] if proxies else None
+    return DDGS(proxy=proxy)
+
+
+def _is_ratelimit(error: Exception) -> bool:
+    """text() embrulha o erro do backend em DuckDuckGoSearchException"""
+    return isinstance(error, RatelimitException) or any(
+        isinstance(arg, RatelimitException) for arg in error.args
+    )
+
+
+def _ddgs_search(method: str, query: str, max_results: int) -> list[dict]:
+    """Chama DDGS.<method>; em rate limit troca de cliente/proxy e tenta de novo"""
+    delay = 1.0
+    for attempt in range(SEARCH_MAX_ATTEMPTS):
+        try:
+            return list(getattr(_get_ddgs(), method)(query, max_results=max_results))
+        except Exception as e:
+            if attempt == SEARCH_MAX_ATTEMPTS - 1 or not _is_ratelimit(e):
+                raise
+            _local.ddgs = _new_ddgs()
+            time.sleep(delay)
+            delay *= 2
+    return []
+
+
+def _cache_get(key: tuple[str, str, int]) -> Optional[str]:
+    """Retorna resultado em cache (ou None se ausente/expirado)"""
+    with _SEARCH_CACHE_LOCK:
+        cached = _SEARCH_CACHE.pop(key, None)
+        if cached and time.monotonic() < cached[0]:
+            # Reinsere no fim: ordem do dict vira ordem de uso (LRU)
+            _SEARCH_CACHE[key] = cached
+            return cached[1]
+    return None
+
+
+def _cache_put(key: tuple[str, str, int], result: str):
+    """Guarda resultado (config.search_cache_ttl); erros nao sao guardados"""
+    ttl = config.search_cache_ttl
+    if ttl <= 0 or result.startswith("Erro"):
+        return
+    with _SEARCH_CACHE_LOCK:
+        if len(_SEARCH_CACHE) >= SEARCH_CACHE_SIZE:
+            _SEARCH_CACHE.pop(next(iter(_SEARCH_CACHE)))
+        _SEARCH_CACHE[key] = (time.monotonic() + ttl, result)
+
+
+def _cached(kind: str, search_fn: Callable[[str, int], str], query: str, max_results: int) -> str:
+    """Executa busca reaproveitando resultados recentes"""
+    key = (kind, query, max_results)
+    result = _cache_get(key)
+    if result is None:
+        with _SEARCH_SLOTS:
+            result = search_fn(query, max_results)
+        _cache_put(key, result)
+    return result
+
+
+async def _cached_async(
+    kind: str,
+    search_fn: Callable[[str, int], str],
+    query: str,
+    max_results: int
+) -> str:
+    """Versao async de _cached: busca em thread, sem repetir buscas ja em andamento"""
+    key = (kind, query, max_results)
+    result = _cache_get(key)
+    if result is not None:
+        return result
+
+    future = _INFLIGHT.get(key)
+    if future is None:
+        future = asyncio.get_running_loop().run_in_executor(
+            _SEARCH_EXECUTOR, _cached, kind, search_fn, query, max_results
+        )
+        _INFLIGHT[key] = future
+        future.add_done_callback(lambda _: _INFLIGHT.pop(key, None))
+    # shield: cancelar um chamador nao cancela a busca dos outros
+    return await asyncio.shield(future)
 
 
 def buscar_web(query: str, max_results: int = 10) -> str:
@@ -16,23 +146,25 @@ def buscar_web(query: str, max_results: int = 10) -> str:
     Returns:
         Resultados formatados como string
     """
+    return _cached("web", _buscar_web, query, max_results)
+
+
+def _buscar_web(query: str, max_results: int) -> str:
+    """Executa buscar_web sem cache"""
     try:
-        with DDGS() as ddgs:
-            results = list(ddgs.text(query, max_results=max_results))
+        results = _ddgs_search("text", query, max_results)
 
         if not results:
             return f"Nenhum resultado encontrado para '{query}'."
 
-        output = f"**Resultados para '{query}':**\n\n"
-        for i, r in enumerate(results, 1):
-            titulo = r.get("title", "Sem titulo")
-            link = r.get("href", "")
-            descricao = r.get("body", "")
-            output += f"{i}. **{titulo}**\n"
-            output += f"   Link: {link}\n"
-            output += f"   {descricao}\n\n"
-
-        return output
+        parts = [f"**Resultados para '{query}':**\n\n"]
+        parts.extend(
+            f"{i}. **{r.get('title', 'Sem titulo')}**\n"
+            f"   Link: {r.get('href', '')}\n"
+            f"   {r.get('body', '')}\n\n"
+            for i, r in enumerate(results, 1)
+        )
+        return "".join(parts)
 
     except Exception as e:
         return f"Erro na busca: {str(e)}"
@@ -49,26 +181,26 @@ def buscar_noticias(query: str, max_results: int = 10) -> str:
     Returns:
         Noticias formatadas como string
     """
+    return _cached("news", _buscar_noticias, query, max_results)
+
+
+def _buscar_noticias(query: str, max_results: int) -> str:
+    """Executa buscar_noticias sem cache"""
     try:
-        with DDGS() as ddgs:
-            results = list(ddgs.news(query, max_results=max_results))
+        results = _ddgs_search("news", query, max_results)
 
         if not results:
             return f"Nenhuma noticia encontrada para '{query}'."
 
-        output = f"**Noticias sobre '{query}':**\n\n"
-        for i, r in enumerate(results, 1):
-            titulo = r.get("title", "Sem titulo")
-            link = r.get("url", "")
-            fonte = r.get("source", "")
-            data = r.get("date", "")
-            descricao = r.get("body", "")
-            output += f"{i}. **{titulo}**\n"
-            output += f"   Fonte: {fonte} | Data: {data}\n"
-            output += f"   Link: {link}\n"
-            output += f"   {descricao}\n\n"
-
-        return output
+        parts = [f"**Noticias sobre '{query}':**\n\n"]
+        parts.extend(
+            f"{i}. **{r.get('title', 'Sem titulo')}**\n"
+            f"   Fonte: {r.get('source', '')} | Data: {r.get('date', '')}\n"
+            f"   Link: {r.get('url', '')}\n"
+            f"   {r.get('body', '')}\n\n"
+            for i, r in enumerate(results, 1)
+        )
+        return "".join(parts)
 
     except Exception as e:
         return f"Erro na busca: {str(e)}"
@@ -85,23 +217,47 @@ def buscar_imagens(query: str, max_results: int = 10) -> str:
     Returns:
         Imagens formatadas como string
     """
+    return _cached("images", _buscar_imagens, query, max_results)
+
+
+def _buscar_imagens(query: str, max_results: int) -> str:
+    """Executa buscar_imagens sem cache"""
     try:
-        with DDGS() as ddgs:
-            results = list(ddgs.images(query, max_results=max_results))
+        results = _ddgs_search("images", query, max_results)
 
         if not results:
             return f"Nenhuma imagem encontrada para '{query}'."
 
-        output = f"**Imagens para '{query}':**\n\n"
-        for i, r in enumerate(results, 1):
-            titulo = r.get("title", "Sem titulo")
-            link = r.get("image", "")
-            fonte = r.get("url", "")
-            output += f"{i}. **{titulo}**\n"
-            output += f"   Imagem: {link}\n"
-            output += f"   Fonte: {fonte}\n\n"
-
-        return output
+        parts = [f"**Imagens para '{query}':**\n\n"]
+        parts.extend(
+            f"{i}. **{r.get('title', 'Sem titulo')}**\n"
+            f"   Imagem: {r.get('image', '')}\n"
+            f"   Fonte: {r.get('url', '')}\n\n"
+            for i, r in enumerate(results, 1)
+        )
+        return "".join(parts)
 
     except Exception as e:
         return f"Erro na busca: {str(e)}"
+
+
+# Versoes async: a busca roda em _SEARCH_EXECUTOR, sem bloquear o event loop
+
+async def buscar_web_async(query: str, max_results: int = 10) -> str:
+    """Versao async de buscar_web"""
+    return await _cached_async("web", _buscar_web, query, max_results)
+
+
+async def buscar_noticias_async(query: str, max_results: int = 10) -> str:
+    """Versao async de buscar_noticias"""
+    return await _cached_async("news", _buscar_noticias, query, max_results)
+
+
+async def buscar_imagens_async(query: str, max_results: int = 10) -> str:
+    """Versao async de buscar_imagens"""
+    return await _cached_async("images", _buscar_imagens, query, max_results)
+
+
+async def buscar_web_varios(queries: list[str], max_results: int = 10) -> list[str]:
+    """Executa varias buscas web em paralelo (resultados na ordem das queries)"""
+    return await asyncio.gather(*(buscar_web_async(q, max_results) for q in queries))
@@ -0,0 +1,18 @@
+"""
+Utilitarios para processos filhos
+"""
+
+import asyncio
+import os
+import signal
+
+
+def kill_process(process: asyncio.subprocess.Process):
+    """Mata o processo e, no POSIX, os filhos do shell (grupo proprio)"""
+    if os.name == "posix":
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+    else:
+        process.kill()
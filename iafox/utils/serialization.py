@@ -0,0 +1,41 @@
+"""
+Serializacao JSON - usa orjson quando disponivel
+"""
+
+import json
+from typing import Any
+
+# Import opcional - orjson e bem mais rapido que o json padrao
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# orjson.JSONDecodeError herda de json.JSONDecodeError
+JSONDecodeError = json.JSONDecodeError
+
+# Header para corpos ja serializados com json_dumpb
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+
+def json_loads(data: str | bytes) -> Any:
+    """Decodifica JSON (str ou bytes)"""
+    if ORJSON_AVAILABLE:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def json_dumps(data: Any, indent: bool = False) -> str:
+    """Codifica JSON; objetos nao serializaveis viram str"""
+    if ORJSON_AVAILABLE:
+        option = orjson.OPT_INDENT_2 if indent else 0
+        return orjson.dumps(data, default=str, option=option).decode()
+    return json.dumps(data, indent=2 if indent else None, default=str, ensure_ascii=False)
+
+
+def json_dumpb(data: Any) -> bytes:
+    """Codifica JSON compacto direto em bytes UTF-8 (corpo de requests HTTP)"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(data, default=str)
+    return json.dumps(data, default=str, ensure_ascii=False, separators=(",", ":")).encode()
@@ -0,0 +1,54 @@
+"""
+Utilitarios para respostas em streaming
+"""
+
+import asyncio
+from typing import AsyncGenerator, AsyncIterable, Optional
+
+
+async def coalesce_chunks(
+    chunks: AsyncIterable[str],
+    max_size: int,
+    interval: float
+) -> AsyncGenerator[str, None]:
+    """
+    Junta chunks que chegam em rajada
+
+    Emite o buffer quando passa de max_size caracteres ou quando `interval`
+    segundos passaram desde a ultima emissao - inclusive enquanto o proximo
+    chunk nao chega (ex.: ferramenta rodando), para o texto ja recebido nao
+    ficar preso.
+    """
+    loop = asyncio.get_running_loop()
+    it = chunks.__aiter__()
+    buf: list[str] = []
+    size = 0
+    last = loop.time()
+    nxt: Optional[asyncio.Future] = None
+    try:
+        while True:
+            # Proximo chunk em task: esperar com timeout nao cancela o gerador
+            nxt = asyncio.ensure_future(it.__anext__())
+            if buf:
+                done, _ = await asyncio.wait({nxt}, timeout=max(last + interval - loop.time(), 0))
+                if not done:
+                    yield "".join(buf)
+                    buf.clear()
+                    size = 0
+                    last = loop.time()
+            try:
+                chunk = await nxt
+            except StopAsyncIteration:
+                break
+            buf.append(chunk)
+            size += len(chunk)
+            if size >= max_size:
+                yield "".join(buf)
+                buf.clear()
+                size = 0
+                last = loop.time()
+        if buf:
+            yield "".join(buf)
+    finally:
+        if nxt is not None and not nxt.done():
+            nxt.cancel()
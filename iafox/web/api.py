@@ -3,24 +3,35 @@ API REST do IAFOX - FastAPI
 """
 
 import asyncio
-from pathlib import Path
-from typing import Optional, AsyncGenerator
+import codecs
+import functools
+import hashlib
+import os
+import time
+from collections import OrderedDict
 from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import AsyncGenerator, AsyncIterable, Awaitable, Callable, Optional
 
-from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import HTMLResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, StreamingResponse
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 
 from ..core.agent import IAFOXAgent
 from ..core.config import config
-from ..llm.ollama_client import OllamaClient
 from ..files.manager import FileManager
+from ..llm.ollama_client import OllamaClient
+from ..utils.process import kill_process
+from ..utils.serialization import json_dumpb, json_loads
+from ..utils.streaming import coalesce_chunks
 
 
-# Modelos de request/response
+# Modelos de request/response (requests imutaveis: so sao lidos pelas rotas)
 class ChatRequest(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     message: str
     workspace: Optional[str] = None
 
@@ -31,23 +42,140 @@ class ChatResponse(BaseModel):
 
 
 class FileRequest(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     path: str
     content: Optional[str] = None
 
 
 class EditRequest(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     path: str
     old_content: str
     new_content: str
 
 
 class CommandRequest(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     command: str
     workspace: Optional[str] = None
 
 
-# Estado global
-agents: dict[str, IAFOXAgent] = {}
+class SearchRequest(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
+    query: str
+    max_results: int = 10
+
+
+# Estado global: agentes por workspace, do menos para o mais usado (LRU)
+agents: OrderedDict[str, IAFOXAgent] = OrderedDict()
+MAX_AGENTS = 32
+
+# Tasks de fechamento de agentes removidos (referencia evita coleta antes do fim)
+_closing: set[asyncio.Task] = set()
+
+# Respostas em streaming: sem cache e sem buffer em proxies (nginx)
+STREAM_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+# Respostas GET recentes (listagens/arvore): chave -> (expira_em, etag, corpo)
+_RESPONSE_CACHE: OrderedDict[tuple, tuple[float, str, bytes]] = OrderedDict()
+RESPONSE_CACHE_SIZE = 256
+RESPONSE_CACHE_TTL = 5.0
+# Geracao do cache: incrementada por invalidate_responses
+_cache_generation = 0
+
+# WebSocket: tokens que chegam juntos vao no mesmo frame (ate 4 KB / 10 ms)
+WS_FLUSH_SIZE = 4096
+WS_FLUSH_INTERVAL = 0.01
+
+# Bytes lidos por vez da saida de comandos em /api/execute
+PROCESS_CHUNK_SIZE = 64 * 1024
+
+# Limita shells simultaneos de /api/execute (cada um segura processo e pipes)
+_EXEC_SLOTS = asyncio.Semaphore(config.max_parallel_commands)
+
+
+async def stream_files_json(items: AsyncIterable[BaseModel]) -> AsyncGenerator[bytes, None]:
+    """Serializa {"files": [...]} item a item, sem montar a resposta inteira"""
+    yield b'{"files":['
+    first = True
+    async for item in items:
+        if not first:
+            yield b","
+        first = False
+        yield item.model_dump_json().encode()
+    yield b"]}"
+
+
+def model_response(model: BaseModel) -> Response:
+    """Serializa modelo direto em JSON pelo pydantic-core, sem passar por dict"""
+    return Response(
+        content=model.__pydantic_serializer__.to_json(model),
+        media_type="application/json"
+    )
+
+
+def _etag(body: bytes) -> str:
+    """ETag forte derivado do conteudo da resposta"""
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def etag_response(http_request: Request, body: bytes, etag: Optional[str] = None) -> Response:
+    """Resposta JSON com ETag; 304 sem corpo se o cliente ja tem esta versao"""
+    etag = etag or _etag(body)
+    # no-cache: navegador sempre revalida, mas so baixa de novo se mudou
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if_none_match = http_request.headers.get("if-none-match", "")
+    if etag in (tag.strip() for tag in if_none_match.split(",")):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+async def cached_response(
+    http_request: Request,
+    key: tuple,
+    build: Callable[[], Awaitable[bytes]]
+) -> Response:
+    """Reaproveita corpo gerado ha menos de RESPONSE_CACHE_TTL segundos"""
+    now = time.monotonic()
+    entry = _RESPONSE_CACHE.get(key)
+    if entry is not None and now < entry[0]:
+        _RESPONSE_CACHE.move_to_end(key)
+        return etag_response(http_request, entry[2], entry[1])
+
+    generation = _cache_generation
+    body = await build()
+    etag = _etag(body)
+    # Invalidado durante o build: o corpo pode estar velho, nao guarda
+    if generation == _cache_generation:
+        _RESPONSE_CACHE[key] = (now + RESPONSE_CACHE_TTL, etag, body)
+        _RESPONSE_CACHE.move_to_end(key)
+        if len(_RESPONSE_CACHE) > RESPONSE_CACHE_SIZE:
+            _RESPONSE_CACHE.popitem(last=False)
+    return etag_response(http_request, body, etag)
+
+
+def invalidate_responses():
+    """Descarta respostas em cache (arquivos podem ter mudado)"""
+    global _cache_generation
+    _cache_generation += 1
+    _RESPONSE_CACHE.clear()
+
+
+async def ws_receive_json(websocket: WebSocket) -> dict:
+    """Recebe frame JSON (texto ou binario) sem passar pelo json padrao"""
+    message = await websocket.receive()
+    if message["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(message.get("code", 1000))
+    return json_loads(message.get("bytes") or message.get("text") or "{}")
+
+
+async def ws_send_json(websocket: WebSocket, data: dict):
+    """Envia JSON em frame binario (sem reencode/revalidacao de texto)"""
+    await websocket.send_bytes(json_dumpb(data))
 
 
 def get_or_create_agent(workspace: str = ".") -> IAFOXAgent:
@@ -55,19 +183,38 @@ def get_or_create_agent(workspace: str = ".") -> IAFOXAgent:
     workspace_path = Path(workspace).resolve()
     key = str(workspace_path)
 
-    if key not in agents:
-        client = OllamaClient()
-        file_manager = FileManager(workspace=workspace_path)
-        agents[key] = IAFOXAgent(llm=client, file_manager=file_manager)
+    # Sem await entre a busca e a insercao: nao ha corrida no event loop
+    agent = agents.get(key)
+    if agent is not None:
+        agents.move_to_end(key)
+        return agent
+
+    client = OllamaClient()
+    file_manager = FileManager(workspace=workspace_path)
+    agent = agents[key] = IAFOXAgent(llm=client, file_manager=file_manager)
 
-    return agents[key]
+    # Limita memoria e pools de conexao: fecha o agente usado ha mais tempo
+    if len(agents) > MAX_AGENTS:
+        _, old = agents.popitem(last=False)
+        task = asyncio.get_running_loop().create_task(old.llm.close())
+        _closing.add(task)
+        task.add_done_callback(_closing.discard)
+
+    return agent
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Lifecycle da aplicacao"""
+    # Cliente compartilhado pelas rotas de modelos (pool de conexoes reaproveitado)
+    app.state.ollama = OllamaClient()
+    # Le a interface antes do primeiro request
+    await asyncio.to_thread(_index_html)
     yield
     # Cleanup
+    await app.state.ollama.close()
+    from ..tools.image.gerar_imagem import fechar_gerador
+    await fechar_gerador()
     for agent in agents.values():
         await agent.llm.close()
 
@@ -92,13 +239,19 @@ app.add_middleware(
 
 # ============ ROTAS ============
 
+@functools.lru_cache(maxsize=1)
+def _index_html() -> bytes:
+    """Interface HTML, lida do disco uma vez por processo"""
+    template_path = Path(__file__).parent / "templates" / "index.html"
+    if template_path.exists():
+        return template_path.read_bytes()
+    return b"<h1>IAFOX API</h1><p>Interface nao encontrada</p>"
+
+
 @app.get("/", response_class=HTMLResponse)
 async def root():
     """Pagina inicial - serve interface HTML"""
-    template_path = Path(__file__).parent / "templates" / "index.html"
-    if template_path.exists():
-        return HTMLResponse(content=template_path.read_text(encoding="utf-8"), status_code=200)
-    return HTMLResponse(content="<h1>IAFOX API</h1><p>Interface nao encontrada</p>")
+    return HTMLResponse(content=_index_html(), status_code=200)
 
 
 @app.get("/health")
@@ -115,10 +268,9 @@ async def chat(request: ChatRequest):
     try:
         agent = get_or_create_agent(request.workspace or ".")
 
-        response_text = ""
-        async for chunk in agent.chat(request.message, stream=False):
-            response_text += chunk
-
+        response_text = await agent.chat_full(request.message)
+        # Ferramentas do agente podem ter alterado arquivos
+        invalidate_responses()
         return ChatResponse(response=response_text, success=True)
 
     except Exception as e:
@@ -131,13 +283,16 @@ async def chat_stream(request: ChatRequest):
     agent = get_or_create_agent(request.workspace or ".")
 
     async def generate():
+        # Chunk em JSON: quebras de linha no texto nao quebram o frame SSE
         async for chunk in agent.chat(request.message, stream=True):
-            yield f"data: {chunk}\n\n"
-        yield "data: [DONE]\n\n"
+            yield b"data: " + json_dumpb({"token": chunk}) + b"\n\n"
+        invalidate_responses()
+        yield b"data: [DONE]\n\n"
 
     return StreamingResponse(
         generate(),
-        media_type="text/event-stream"
+        media_type="text/event-stream",
+        headers={**STREAM_HEADERS, "Connection": "keep-alive"}
     )
 
 
@@ -151,27 +306,30 @@ async def websocket_chat(websocket: WebSocket):
 
     try:
         while True:
-            data = await websocket.receive_json()
+            data = await ws_receive_json(websocket)
 
             if data.get("type") == "message":
                 message = data.get("content", "")
 
-                async for chunk in agent.chat(message, stream=True):
-                    await websocket.send_json({
+                async for chunk in coalesce_chunks(
+                    agent.chat(message, stream=True), WS_FLUSH_SIZE, WS_FLUSH_INTERVAL
+                ):
+                    await ws_send_json(websocket, {
                         "type": "chunk",
                         "content": chunk
                     })
 
-                await websocket.send_json({"type": "done"})
+                invalidate_responses()
+                await ws_send_json(websocket, {"type": "done"})
 
             elif data.get("type") == "clear":
                 agent.clear_conversation()
-                await websocket.send_json({"type": "cleared"})
+                await ws_send_json(websocket, {"type": "cleared"})
 
             elif data.get("type") == "workspace":
                 workspace = data.get("path", ".")
                 agent = get_or_create_agent(workspace)
-                await websocket.send_json({
+                await ws_send_json(websocket, {
                     "type": "workspace_changed",
                     "path": workspace
                 })
@@ -192,16 +350,20 @@ async def clear_chat(workspace: Optional[str] = None):
 
 @app.get("/api/files")
 async def list_files(
+    http_request: Request,
     path: str = ".",
     recursive: bool = False,
     workspace: Optional[str] = None
 ):
     """Lista arquivos"""
     agent = get_or_create_agent(workspace or ".")
-    files = await agent.file_manager.list_directory(path, recursive)
-    return {
-        "files": [f.model_dump() for f in files]
-    }
+
+    async def build() -> bytes:
+        files = await agent.file_manager.list_directory(path, recursive)
+        return json_dumpb({"files": [f.model_dump() for f in files]})
+
+    key = ("files", str(agent.file_manager.workspace), path, recursive)
+    return await cached_response(http_request, key, build)
 
 
 @app.get("/api/files/read")
@@ -210,7 +372,7 @@ async def read_file(path: str, workspace: Optional[str] = None):
     agent = get_or_create_agent(workspace or ".")
     try:
         content = await agent.file_manager.read_file(path)
-        return content.model_dump()
+        return model_response(content)
     except FileNotFoundError:
         raise HTTPException(status_code=404, detail="Arquivo nao encontrado")
 
@@ -223,7 +385,8 @@ async def write_file(request: FileRequest, workspace: Optional[str] = None):
         raise HTTPException(status_code=400, detail="Conteudo obrigatorio")
 
     info = await agent.file_manager.write_file(request.path, request.content)
-    return info.model_dump()
+    invalidate_responses()
+    return model_response(info)
 
 
 @app.post("/api/files/edit")
@@ -236,7 +399,8 @@ async def edit_file(request: EditRequest, workspace: Optional[str] = None):
             request.old_content,
             request.new_content
         )
-        return content.model_dump()
+        invalidate_responses()
+        return model_response(content)
     except FileNotFoundError:
         raise HTTPException(status_code=404, detail="Arquivo nao encontrado")
     except ValueError as e:
@@ -248,19 +412,25 @@ async def delete_file(path: str, workspace: Optional[str] = None):
     """Deleta arquivo"""
     agent = get_or_create_agent(workspace or ".")
     result = await agent.file_manager.delete_file(path)
+    invalidate_responses()
     return {"success": result}
 
 
 @app.get("/api/files/tree")
 async def file_tree(
+    http_request: Request,
     path: str = ".",
     max_depth: int = 3,
     workspace: Optional[str] = None
 ):
     """Arvore de arquivos"""
     agent = get_or_create_agent(workspace or ".")
-    tree = await agent.file_manager.get_file_tree(path, max_depth)
-    return tree
+
+    async def build() -> bytes:
+        return json_dumpb(await agent.file_manager.get_file_tree(path, max_depth))
+
+    key = ("tree", str(agent.file_manager.workspace), path, max_depth)
+    return await cached_response(http_request, key, build)
 
 
 @app.get("/api/files/search")
@@ -272,33 +442,128 @@ async def search_files(
 ):
     """Busca arquivos"""
     agent = get_or_create_agent(workspace or ".")
-    files = await agent.file_manager.search_files(pattern, path, content)
-    return {"files": [f.model_dump() for f in files]}
+    # Resultados saem conforme a busca por conteudo avanca
+    files = await agent.file_manager.iter_search_files(pattern, path, content)
+    return StreamingResponse(
+        stream_files_json(files),
+        media_type="application/json",
+        headers=STREAM_HEADERS
+    )
 
 
 # ---- Comandos ----
 
+async def _stream_process(
+    process: asyncio.subprocess.Process,
+    timeout: float
+) -> AsyncGenerator[bytes, None]:
+    """Intercala stdout/stderr do processo em linhas NDJSON; termina com o exit_code"""
+    # Fila limitada: processo que escreve rapido espera o cliente consumir
+    queue: asyncio.Queue = asyncio.Queue(maxsize=64)
+
+    async def pump(reader: asyncio.StreamReader, name: str):
+        # Decoder incremental: caractere multibyte pode chegar dividido entre blocos
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        try:
+            while chunk := await reader.read(PROCESS_CHUNK_SIZE):
+                await queue.put((name, decoder.decode(chunk)))
+            await queue.put((name, decoder.decode(b"", final=True)))
+        except Exception:
+            pass
+        await queue.put(None)
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout if timeout else None
+
+    def remaining() -> Optional[float]:
+        return None if deadline is None else max(deadline - loop.time(), 0)
+
+    pumps = [
+        asyncio.create_task(pump(process.stdout, "stdout")),
+        asyncio.create_task(pump(process.stderr, "stderr")),
+    ]
+    try:
+        try:
+            open_streams = len(pumps)
+            while open_streams:
+                item = await asyncio.wait_for(queue.get(), remaining())
+                if item is None:
+                    open_streams -= 1
+                elif item[1]:
+                    yield json_dumpb({"stream": item[0], "data": item[1]}) + b"\n"
+            await asyncio.wait_for(process.wait(), remaining())
+        except asyncio.TimeoutError:
+            kill_process(process)
+            await process.wait()
+            yield json_dumpb({
+                "error": f"Tempo limite excedido ({timeout:g}s) - processo encerrado"
+            }) + b"\n"
+
+        yield json_dumpb({"exit_code": process.returncode}) + b"\n"
+    finally:
+        # Cliente desconectou antes do fim: nao deixa o processo orfao
+        for task in pumps:
+            task.cancel()
+        if process.returncode is None:
+            kill_process(process)
+            await process.wait()
+
+
+async def _run_command(command: str, cwd: Path) -> AsyncGenerator[bytes, None]:
+    """Executa comando ocupando uma vaga de _EXEC_SLOTS ate o fim da saida"""
+    # Vaga obtida dentro do generator: resposta nunca iniciada nao prende vaga
+    async with _EXEC_SLOTS:
+        try:
+            process = await asyncio.create_subprocess_shell(
+                command,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                cwd=str(cwd),
+                # Grupo proprio para o timeout matar tambem os filhos do shell
+                start_new_session=os.name == "posix"
+            )
+        except OSError as e:
+            yield json_dumpb({"error": str(e)}) + b"\n"
+            return
+
+        try:
+            async for line in _stream_process(process, config.command_timeout):
+                yield line
+        finally:
+            # O comando pode ter criado/removido arquivos
+            invalidate_responses()
+
+
 @app.post("/api/execute")
 async def execute_command(request: CommandRequest):
-    """Executa comando no terminal"""
-    import asyncio
-
+    """Executa comando no terminal (saida em NDJSON, conforme o processo escreve)"""
     workspace = Path(request.workspace or ".").resolve()
 
-    process = await asyncio.create_subprocess_shell(
-        request.command,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE,
-        cwd=str(workspace)
+    return StreamingResponse(
+        _run_command(request.command, workspace),
+        media_type="application/x-ndjson",
+        headers=STREAM_HEADERS
     )
 
-    stdout, stderr = await process.communicate()
 
-    return {
-        "stdout": stdout.decode() if stdout else "",
-        "stderr": stderr.decode() if stderr else "",
-        "exit_code": process.returncode
-    }
+# ---- Busca ----
+
+@app.post("/api/search")
+async def search_all(request: SearchRequest):
+    """Busca web, noticias e imagens em paralelo (demora o tempo da mais lenta)"""
+    from ..tools.web_search import buscar_imagens_async, buscar_noticias_async, buscar_web_async
+
+    # return_exceptions: falha em um tipo nao cancela os outros
+    results = await asyncio.gather(
+        buscar_web_async(request.query, request.max_results),
+        buscar_noticias_async(request.query, request.max_results),
+        buscar_imagens_async(request.query, request.max_results),
+        return_exceptions=True
+    )
+    web, news, images = (
+        f"Erro na busca: {r}" if isinstance(r, Exception) else r for r in results
+    )
+    return {"web": web, "news": news, "images": images}
 
 
 # ---- Modelos ----
@@ -306,24 +571,19 @@ async def execute_command(request: CommandRequest):
 @app.get("/api/models")
 async def list_models():
     """Lista modelos do Ollama"""
-    client = OllamaClient()
-    try:
-        models = await client.list_models()
-        return {"models": models}
-    finally:
-        await client.close()
+    models = await app.state.ollama.list_models()
+    return {"models": models}
 
 
 @app.post("/api/models/pull/{model_name}")
 async def pull_model(model_name: str):
     """Baixa modelo"""
-    client = OllamaClient()
+    client = app.state.ollama
 
     async def generate():
         async for progress in client.pull_model(model_name):
             yield f"data: {progress}\n\n"
         yield "data: [DONE]\n\n"
-        await client.close()
 
     return StreamingResponse(
         generate(),
@@ -334,9 +594,9 @@ async def pull_model(model_name: str):
 # ---- Config ----
 
 @app.get("/api/config")
-async def get_config():
+async def get_config(http_request: Request):
     """Retorna configuracao atual"""
-    return config.model_dump()
+    return etag_response(http_request, config.__pydantic_serializer__.to_json(config))
 
 
 def run_server(host: str = "0.0.0.0", port: int = 8000):
@@ -0,0 +1,39 @@
+"""
+Testes da deteccao de chamadas de ferramentas do agente
+"""
+
+from iafox.core.agent import _scan_tool_calls, _ToolCallStream
+
+
+def test_scan_continua_apos_args_sem_chave_final():
+    text = (
+        '<tool>a</tool><args>{"n":1</args> ok '
+        '<tool>b</tool><args>{"m":2}</args>'
+    )
+    found, _ = _scan_tool_calls(text)
+    assert found == [("b", '{"m":2}')]
+
+
+def test_scan_final_continua_apos_string_sem_fim():
+    text = (
+        '<tool>a</tool><args>{"n":"x</args> ok '
+        '<tool>b</tool><args>{"m":2}</args>'
+    )
+    found, _ = _scan_tool_calls(text, final=True)
+    assert found == [("b", '{"m":2}')]
+
+
+def test_scan_aceita_args_fechando_dentro_de_string():
+    text = '<tool>write_file</tool><args>{"content": "}</args>"}</args>'
+    found, _ = _scan_tool_calls(text)
+    assert found == [("write_file", '{"content": "}</args>"}')]
+
+
+def test_stream_descarta_chamada_invalida_e_emite_as_seguintes():
+    text = '<tool>a</tool><args>{"n":"x</args> ' + 'ok <tool>b</tool><args>{"m":2}</args> ' * 3
+    scanner = _ToolCallStream()
+    found = []
+    for i in range(0, len(text), 5):
+        found += scanner.feed(text[i:i + 5])
+    found += scanner.finish()
+    assert found == [("b", '{"m":2}')] * 3